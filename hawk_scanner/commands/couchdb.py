@@ -18,27 +18,31 @@ def connect_couchdb(args, host, port, username, password, database):
         system.print_error(args, f"Failed to connect to CouchDB database with error: {e}")
         return None
 
-def check_data_patterns(db, patterns, profile_name, database_name):
+def check_data_patterns(args, db, patterns, profile_name, database_name):
     results = []
+    values, keys = [], []
     for doc_id in db:
+        if not system.in_shard(args, 'couchdb', profile_name, database_name, doc_id):
+            continue
         document = db[doc_id]
         for field_name, field_value in document.items():
             if field_value:
-                value_str = str(field_value)
-                matches = system.match_strings(args, value_str)
-                if matches:
-                    for match in matches:
-                        results.append({
-                            'host': f"{db.resource.credentials[1]}:{db.resource.credentials[2]}",
-                            'database': database_name,
-                            'document_id': doc_id,
-                            'field': field_name,
-                            'pattern_name': match['pattern_name'],
-                            'matches': match['matches'],
-                            'sample_text': match['sample_text'],
-                            'profile': profile_name,
-                            'data_source': 'couchdb'
-                        })
+                values.append(str(field_value))
+                keys.append((doc_id, field_name))
+
+    for (doc_id, field_name), matches in system.match_batch(args, values, keys, patterns=patterns):
+        for match in matches:
+            results.append({
+                'host': f"{db.resource.credentials[1]}:{db.resource.credentials[2]}",
+                'database': database_name,
+                'document_id': doc_id,
+                'field': field_name,
+                'pattern_name': match['pattern_name'],
+                'matches': match['matches'],
+                'sample_text': match['sample_text'],
+                'profile': profile_name,
+                'data_source': 'couchdb'
+            })
 
     return results
 
@@ -52,7 +56,7 @@ def execute(args):
         couchdb_config = sources_config.get('couchdb')
 
         if couchdb_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for key, config in couchdb_config.items():
                 host = config.get('host')
@@ -69,7 +73,7 @@ def execute(args):
 
                 db = connect_couchdb(args, host, port, username, password, database)
                 if db:
-                    results += check_data_patterns(db, patterns, key, database)
+                    results += check_data_patterns(args, db, patterns, key, database)
         else:
             system.print_error(args, "No CouchDB connection details found in connection.yml")
     else:
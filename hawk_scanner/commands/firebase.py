@@ -41,6 +41,8 @@ def execute(args):
 
                             if system.should_exclude_file(args, file_name, exclude_patterns):
                                 continue
+                            if not system.in_shard(args, 'firebase', key, bucket_name, file_name):
+                                continue
 
                             file_path = f"data/firebase/{remote_etag}-{file_name}"
                             os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -65,7 +67,7 @@ def execute(args):
                             matches = system.read_match_strings(args, file_path, 'google_cloud_storage')
                             if matches:
                                 for match in matches:
-                                    results.append({
+                                    result = {
                                         'bucket': bucket_name,
                                         'file_path': file_name,
                                         'pattern_name': match['pattern_name'],
@@ -73,7 +75,8 @@ def execute(args):
                                         'sample_text': match['sample_text'],
                                         'profile': key,
                                         'data_source': 'firebase'
-                                    })
+                                    }
+                                    results.append(system.add_match_details(result, match))
 
                     else:
                         system.print_error(args, f"Failed to connect to Firebase bucket: {bucket_name}")
@@ -1,17 +1,72 @@
-import argparse
-from google.cloud import storage
-from rich.console import Console
-from hawk_scanner.internals import system
+from hawk_scanner.internals import system, file_index
 import os
 import concurrent.futures
+import queue
+import threading
 import time
 
-def process_file(args, file_path, key, results):
-    matches = system.read_match_strings(args, file_path, 'fs')
-    file_data = system.getFileData(file_path)
+EXECUTORS = ('threads', 'processes', 'hybrid')
+## images, videos and archives mostly wait on tesseract, OpenCV and patool, which release the GIL,
+## so in hybrid mode they stay on threads and only the regex-heavy files go to processes
+THREAD_FRIENDLY_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.mp4', '.avi', '.mov', '.mkv', '.zip', '.rar', '.tar', '.tar.gz')
+## upper bound of walked paths waiting to be scanned, and of files being scanned at once
+QUEUE_SIZE = 256
+_WALK_DONE = object()
+
+def put_path(work_queue, item, stop):
+    while not stop.is_set():
+        try:
+            work_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def walk_files(args, files, work_queue, stop, with_stat=False):
+    """
+    Walker thread: put the walked (file path, stat) pairs on the bounded work queue, blocking while it is full.
+
+    :param files: Iterable of file paths or of DirEntry from the system.walk_tree generator.
+    :param work_queue: Bounded queue.Queue the scanner takes the paths from.
+    :param stop: threading.Event set by the scanner when it stops early.
+    :param with_stat: Whether to stat the files, otherwise (or when it fails) the stat is None.
+    """
+    try:
+        for entry in files:
+            file_path = entry if isinstance(entry, str) else entry.path
+            stat = None
+            if with_stat:
+                try:
+                    ## a DirEntry reuses what the directory listing already returned
+                    stat = os.stat(file_path) if isinstance(entry, str) else entry.stat()
+                except OSError as e:
+                    system.print_debug(args, f"Unable to stat {file_path}: {e}")
+            if not put_path(work_queue, (file_path, stat), stop):
+                return
+    except Exception as e:
+        system.print_error(args, f"Failed to walk files: {e}")
+    put_path(work_queue, _WALK_DONE, stop)
+
+def scan_file(args, file_path, stat=None, hash_content=False, known_hash=None):
+    ## runs in thread or process workers, so it only returns plain, picklable data
+    content_hash = None
+    if hash_content:
+        try:
+            content_hash = file_index.hash_file(file_path)
+        except OSError as e:
+            system.print_debug(args, f"Unable to hash {file_path}, it is not indexed: {e}")
+        if content_hash is not None and content_hash == known_hash:
+            ## only the stat fields changed, the indexed findings still hold
+            return None, None, None, content_hash
+    matches = system.read_match_strings(args, file_path, 'fs', content_hash)
+    ## metadata is only reported along with findings
+    file_data = system.getFileData(file_path, stat) if matches else None
+    return matches, file_data, system.take_worker_pattern_stats(args), content_hash
+
+def process_file(file_path, key, matches, file_data, results):
     if matches:
         for match in matches:
-            results.append({
+            result = {
                 'host': 'This PC',
                 'file_path': file_path,
                 'pattern_name': match['pattern_name'],
@@ -20,7 +75,172 @@ def process_file(args, file_path, key, results):
                 'profile': key,
                 'data_source': 'fs',
                 'file_data': file_data
-            })
+            }
+            results.append(system.add_match_details(result, match))
+
+class FsScan:
+    """
+    Submits the walked files of one fs profile to the pools and is the single collector of their results.
+
+    With an index, files whose stat fields did not change are not read, and files whose content
+    hash did not change are not scanned again. With dedup, a file whose size was already seen is
+    hashed first and only scanned when no other file with the same content was. The findings of
+    that content are then reported for every path holding it.
+
+    :param pools: (thread pool, process pool) from create_executors, one of them may be None.
+    :param index: FileIndex of an incremental scan, updated with the scanned files.
+    :param report_unchanged: Whether to report the indexed findings of files whose content did not change.
+    :param dedup: Whether to scan byte-identical files only once.
+    """
+
+    def __init__(self, args, key, pools, index=None, report_unchanged=True, dedup=False):
+        self.args = args
+        self.key = key
+        self.thread_pool, self.process_pool = pools
+        self.index = index
+        self.report_unchanged = report_unchanged
+        self.dedup = dedup
+        self.results = []
+        self.pending = {}
+        self.unchanged_count = 0
+        self.duplicate_count = 0
+        ## size -> scans of that size still running without a known content hash
+        self.sizes = {}
+        ## size -> hashed files waiting for those scans, they may hold the same content
+        self.parked = {}
+        ## content hash -> {'matches': findings once scanned, 'waiting': duplicates until then}
+        self.contents = {}
+
+    def executor_for(self, file_path):
+        if self.process_pool is None or (self.thread_pool and file_path.lower().endswith(THREAD_FRIENDLY_EXTENSIONS)):
+            return self.thread_pool
+        return self.process_pool
+
+    def add(self, file_path, stat):
+        entry = None
+        if self.index and stat is not None:
+            entry = self.index.get(file_path)
+            ## unchanged stat fields: skip the file without reading it
+            if entry and entry[0] == file_index.stat_key(stat):
+                self.unchanged_count += 1
+                self.report_indexed(file_path, entry)
+                return
+        if self.dedup and stat is not None:
+            if stat.st_size in self.sizes:
+                future = (self.thread_pool or self.process_pool).submit(file_index.hash_file, file_path)
+                self.pending[future] = 'hash', file_path, stat, entry, None
+                return
+            self.sizes[stat.st_size] = 1
+        self.submit_scan(file_path, stat, entry)
+
+    def submit_scan(self, file_path, stat, entry, content_hash=None):
+        ## without a known content hash, the scan computes it for the index and dedup
+        hash_content = content_hash is None and stat is not None and bool(self.index or self.dedup)
+        future = self.executor_for(file_path).submit(scan_file, self.args, file_path, stat, hash_content, entry[1] if entry else None)
+        self.pending[future] = 'scan', file_path, stat, entry, content_hash
+
+    def collect(self, return_when):
+        """
+        Wait for the pending hashes and scans and handle their results, which may submit more scans.
+
+        :param return_when: concurrent.futures.FIRST_COMPLETED or ALL_COMPLETED.
+        """
+        done, _ = concurrent.futures.wait(self.pending, return_when=return_when)
+        for future in done:
+            kind, file_path, stat, entry, content_hash = self.pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                if kind == 'hash':
+                    system.print_debug(self.args, f"Unable to hash {file_path}, scanning it: {e}")
+                    self.submit_scan(file_path, None, entry)
+                    continue
+                system.print_error(self.args, f"Failed to scan file {file_path}: {e}")
+                result = None
+            if kind == 'hash':
+                self.hashed(file_path, stat, entry, result)
+            else:
+                self.scanned(file_path, stat, entry, content_hash, result)
+
+    def finish(self):
+        while self.pending:
+            self.collect(concurrent.futures.ALL_COMPLETED)
+
+    def hashed(self, file_path, stat, entry, content_hash):
+        if entry and content_hash == entry[1]:
+            self.index.touch(file_path, stat)
+            self.report_indexed(file_path, entry)
+            self.contents.setdefault(content_hash, {'matches': entry[2]['matches'] or [], 'waiting': []})
+            return
+        content = self.contents.get(content_hash)
+        if content is not None:
+            self.duplicate_count += 1
+            if content['matches'] is None:
+                content['waiting'].append((file_path, stat))
+            else:
+                self.found(file_path, stat, content_hash, content['matches'])
+        elif self.sizes.get(stat.st_size):
+            self.parked.setdefault(stat.st_size, []).append((file_path, stat, entry, content_hash))
+        else:
+            self.contents[content_hash] = {'matches': None, 'waiting': []}
+            self.submit_scan(file_path, stat, entry, content_hash)
+
+    def scanned(self, file_path, stat, entry, content_hash, result):
+        matches, file_data, pattern_stats, scanned_hash = result or (None, None, None, None)
+        if content_hash is None and self.dedup and stat is not None:
+            ## first file of its size, its hash is only known now
+            self.sizes[stat.st_size] -= 1
+            content_hash = scanned_hash
+            if content_hash is not None and result and content_hash not in self.contents:
+                self.contents[content_hash] = {'matches': None, 'waiting': []}
+        content_hash = content_hash or scanned_hash
+        if result is None:
+            ## the duplicates would fail the same way, scan them anyway to report their own errors. Their
+            ## hash is known, so they are not counted as first scans of their size in self.sizes
+            content = self.contents.pop(content_hash, None) if content_hash else None
+            for duplicate_path, duplicate_stat in (content['waiting'] if content else []):
+                self.submit_scan(duplicate_path, duplicate_stat, None, content_hash)
+        elif entry and matches is None and scanned_hash == entry[1]:
+            self.index.touch(file_path, stat)
+            self.report_indexed(file_path, entry)
+            if content_hash in self.contents:
+                self.release(content_hash, entry[2]['matches'])
+        else:
+            system.merge_pattern_stats(self.args, pattern_stats)
+            self.found(file_path, stat, content_hash, matches, file_data)
+            if content_hash in self.contents:
+                self.release(content_hash, matches)
+        if stat is not None and not self.sizes.get(stat.st_size):
+            for parked in self.parked.pop(stat.st_size, []):
+                self.hashed(*parked)
+
+    def release(self, content_hash, matches):
+        content = self.contents[content_hash]
+        content['matches'] = matches or []
+        waiting, content['waiting'] = content['waiting'], []
+        for duplicate_path, duplicate_stat in waiting:
+            self.found(duplicate_path, duplicate_stat, content_hash, matches)
+
+    def found(self, file_path, stat, content_hash, matches, file_data=None):
+        if matches and file_data is None:
+            file_data = system.getFileData(file_path, stat)
+        if matches:
+            system.print_info(self.args, f"Found {', '.join(match['pattern_name'] for match in matches)} in {file_path}")
+        if self.index and stat is not None and content_hash:
+            self.index.update(file_path, stat, content_hash, {'matches': matches, 'file_data': file_data})
+        process_file(file_path, self.key, matches, file_data, self.results)
+
+    def report_indexed(self, file_path, entry):
+        if self.report_unchanged:
+            process_file(file_path, self.key, entry[2]['matches'], entry[2]['file_data'], self.results)
+
+def create_executors(args, executor_type, workers):
+    thread_pool = process_pool = None
+    if executor_type in ('processes', 'hybrid'):
+        process_pool = system.create_process_pool(args, workers)
+    if executor_type in ('threads', 'hybrid'):
+        thread_pool = concurrent.futures.ThreadPoolExecutor(workers)
+    return thread_pool, process_pool
 
 def execute(args):
     results = []
@@ -38,24 +258,66 @@ def execute(args):
                     system.print_error(args, f"Path '{path}' does not exist")
                 
                 exclude_patterns = fs_config.get(key, {}).get('exclude_patterns', [])
+                symlinks = config.get('symlinks', 'files')
+                if symlinks not in system.SYMLINK_POLICIES:
+                    system.print_error(args, f"Unknown symlinks policy '{symlinks}' in fs profile '{key}', use one of {', '.join(system.SYMLINK_POLICIES)}. Falling back to files")
+                    symlinks = 'files'
+                executor_type = config.get('executor', 'threads')
+                if executor_type not in EXECUTORS:
+                    system.print_error(args, f"Unknown executor '{executor_type}' in fs profile '{key}', use one of {', '.join(EXECUTORS)}. Falling back to threads")
+                    executor_type = 'threads'
+                workers = config.get('workers')
+                queue_size = max(1, int(config.get('queue_size', QUEUE_SIZE)))
+                report_unchanged = config.get('unchanged_findings', 'report') != 'suppress'
+                dedup = bool(config.get('dedup', False))
+                index = None
+                if config.get('incremental'):
+                    index = file_index.FileIndex(file_index.INDEX_PATH, file_index.fingerprint_digest(system.get_pattern_set(args)))
                 start_time = time.time()
                 ## CHECK If file or directory
                 if os.path.isfile(path):
                     files = [path]
                 else:
-                    files = system.list_all_files_iteratively(args, path, exclude_patterns)
+                    files = system.walk_tree(args, path, exclude_patterns, max_depth=config.get('max_depth'), symlinks=symlinks,
+                                             one_file_system=config.get('one_file_system', False))
+                if system.get_shard(args):
+                    files = (entry for entry in files if system.in_shard(args, 'fs', key, entry if isinstance(entry, str) else entry.path))
                 
-                # Use ThreadPoolExecutor for parallel processing
+                # Threads share one core for regex work, processes scale it over all cores
+                system.print_debug(args, f"Scanning fs profile '{key}' with the {executor_type} executor")
+                scan = FsScan(args, key, create_executors(args, executor_type, workers), index, report_unchanged, dedup)
+                ## the walker, the queue and the number of files in flight are all bounded, so memory
+                ## stays flat on huge trees and findings are reported as soon as their file is scanned
+                work_queue = queue.Queue(maxsize=queue_size)
+                stop = threading.Event()
+                walker = threading.Thread(target=walk_files, args=(args, files, work_queue, stop, bool(index or dedup)), daemon=True)
+                walker.start()
                 file_count = 0
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = []
-                    for file_path in files:
+                try:
+                    while True:
+                        item = work_queue.get()
+                        if item is _WALK_DONE:
+                            break
                         file_count += 1
-                        futures.append(executor.submit(process_file, args, file_path, key, results))
-                    
-                    # Wait for all tasks to complete
-                    concurrent.futures.wait(futures)
+                        scan.add(*item)
+                        if len(scan.pending) >= queue_size:
+                            scan.collect(concurrent.futures.FIRST_COMPLETED)
+
+                    # Wait for the remaining tasks to complete
+                    scan.finish()
+                finally:
+                    stop.set()
+                    for executor in (scan.thread_pool, scan.process_pool):
+                        if executor:
+                            executor.shutdown()
+                    if index:
+                        index.close()
+                results += scan.results
                 end_time = time.time()
+                if index:
+                    system.print_info(args, f"Skipped {scan.unchanged_count} files unchanged since the last run")
+                if dedup:
+                    system.print_info(args, f"Skipped {scan.duplicate_count} files with the same content as another scanned file")
                 system.print_info(args, f"Time taken to analyze {file_count} files: {end_time - start_time} seconds")
         else:
             system.print_error(args, "No filesystem 'fs' connection details found in connection.yml")
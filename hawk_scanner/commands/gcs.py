@@ -55,6 +55,8 @@ def execute(args):
 
                             if system.should_exclude_file(args, file_name, exclude_patterns):
                                 continue
+                            if not system.in_shard(args, 'gcs', key, bucket_name, file_name):
+                                continue
 
                             file_path = f"data/google_cloud_storage/{remote_etag}-{file_name}"
                             os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -78,7 +80,7 @@ def execute(args):
                             matches = system.read_match_strings(args, file_path, 'google_cloud_storage')
                             if matches:
                                 for match in matches:
-                                    results.append({
+                                    result = {
                                         'bucket': bucket_name,
                                         'file_path': file_name,
                                         'pattern_name': match['pattern_name'],
@@ -86,7 +88,8 @@ def execute(args):
                                         'sample_text': match['sample_text'],
                                         'profile': key,
                                         'data_source': 'gcs'
-                                    })
+                                    }
+                                    results.append(system.add_match_details(result, match))
                     else:
                         system.print_error(args, f"Failed to connect to Google Cloud Storage bucket: {bucket_name}")
                 else:
@@ -90,6 +90,8 @@ def execute(args):
             if drive:
                 files = list_files(drive, folder_name=folder_name)
                 for file_obj in files:
+                    if not system.in_shard(args, 'gdrive', key, file_obj['id']):
+                        continue
                     download_file(drive, file_obj, "data/google_drive")
                     file_id = file_obj['id']
                     file_name = file_obj['title']
@@ -123,7 +125,7 @@ def execute(args):
                     matches = system.read_match_strings(args, file_path, 'gdrive')
                     if matches:
                         for match in matches:
-                            results.append({
+                            results.append(system.add_match_details({
                                 'file_id': file_id,
                                 'file_name': file_name,
                                 'file_path': file_path,
@@ -132,7 +134,7 @@ def execute(args):
                                 'sample_text': match['sample_text'],
                                 'profile': key,
                                 'data_source': 'gdrive'
-                            })
+                            }, match))
             else:
                 system.print_error(args, "Failed to connect to Google Drive")
     else:
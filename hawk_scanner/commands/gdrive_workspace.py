@@ -106,7 +106,9 @@ def execute(args):
                 if drive:
                     files = list_files(drive, impersonate_user)
                     for file_obj in files:
-                        
+                        if not system.in_shard(args, 'gdrive_workspace', key, impersonate_user, file_obj['id']):
+                            continue
+
                         if 'mimeType' in file_obj and file_obj['mimeType'] == 'application/vnd.google-apps.document' or file_obj['mimeType'] == 'application/vnd.google-apps.spreadsheet' or file_obj['mimeType'] == 'application/vnd.google-apps.presentation' or file_obj['mimeType'] == 'application/vnd.google-apps.drawing' or file_obj['mimeType'] == 'application/vnd.google-apps.script':
                             file_obj['name'] = file_obj['name'] + '-runtime.pdf'
 
@@ -132,7 +134,7 @@ def execute(args):
                         file_name = file_name.replace('-runtime.pdf', '')
                         if matches:
                             for match in matches:
-                                results.append({
+                                results.append(system.add_match_details({
                                     'file_id': file_id,
                                     'file_name': file_name,
                                     'user': impersonate_user,
@@ -142,7 +144,7 @@ def execute(args):
                                     'sample_text': match['sample_text'],
                                     'profile': key,
                                     'data_source': 'gdrive_workspace'
-                                })
+                                }, match))
                 else:
                     system.print_error(args, "Failed to connect to Google Drive")
     else:
@@ -31,6 +31,7 @@ def check_data_patterns(args, db, patterns, profile_name, database_name, limit_s
         collections_to_scan = [collection for collection in all_collections if collection in whitelisted_collections]
     else:
         collections_to_scan = all_collections or []
+    collections_to_scan = [collection for collection in collections_to_scan if system.in_shard(args, 'mongodb', profile_name, database_name, collection)]
 
     for collection_name in collections_to_scan:
         if collection_name not in all_collections:
@@ -38,24 +39,26 @@ def check_data_patterns(args, db, patterns, profile_name, database_name, limit_s
             continue
 
         collection = db[collection_name]
+        values, keys = [], []
         for document in collection.find().limit(limit_end).skip(limit_start):
             for field_name, field_value in document.items():
                 if field_value:
-                    value_str = str(field_value)
-                    matches = system.match_strings(args, value_str)
-                    if matches:
-                        for match in matches:
-                            results.append({
-                                'host': db.client.address[0],
-                                'database': database_name,
-                                'collection': collection_name,
-                                'field': field_name,
-                                'pattern_name': match['pattern_name'],
-                                'matches': match['matches'],
-                                'sample_text': match['sample_text'],
-                                'profile': profile_name,
-                                'data_source': 'mongodb'
-                            })
+                    values.append(str(field_value))
+                    keys.append(field_name)
+
+        for field_name, matches in system.match_batch(args, values, keys, patterns=patterns):
+            for match in matches:
+                results.append({
+                    'host': db.client.address[0],
+                    'database': database_name,
+                    'collection': collection_name,
+                    'field': field_name,
+                    'pattern_name': match['pattern_name'],
+                    'matches': match['matches'],
+                    'sample_text': match['sample_text'],
+                    'profile': profile_name,
+                    'data_source': 'mongodb'
+                })
 
     return results
 
@@ -69,7 +72,7 @@ def execute(args):
         mongodb_config = sources_config.get('mongodb')
 
         if mongodb_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for key, config in mongodb_config.items():
                 host = config.get('host')
@@ -29,6 +29,7 @@ def check_data_patterns(args, conn, patterns, profile_name, database_name, limit
         tables_to_scan = [table for table in tables if table in whitelisted_tables]
     else:
         tables_to_scan = tables or []
+    tables_to_scan = [table for table in tables_to_scan if system.in_shard(args, 'mysql', profile_name, database_name, table)]
 
     table_count = 1
 
@@ -37,29 +38,28 @@ def check_data_patterns(args, conn, patterns, profile_name, database_name, limit
         cursor.execute(f"SELECT * FROM {table} LIMIT {limit_end} OFFSET {limit_start}")
         columns = [column[0] for column in cursor.description]
 
-        data_count = 1
+        values, keys = [], []
         for row in cursor.fetchall():
             for column, value in zip(columns, row):
                 if exclude_columns and column in exclude_columns:
                     continue
                 if value:
-                    value_str = str(value)
-                    matches = system.match_strings(args, value_str)
-                    if matches:
-                        for match in matches:
-                            results.append({
-                                'host': conn.get_host_info(),
-                                'database': database_name,
-                                'table': table,
-                                'column': column,
-                                'pattern_name': match['pattern_name'],
-                                'matches': match['matches'],
-                                'sample_text': match['sample_text'],
-                                'profile': profile_name,
-                                'data_source': 'mysql'
-                            })
+                    values.append(str(value))
+                    keys.append(column)
 
-            data_count += 1
+        for column, matches in system.match_batch(args, values, keys, patterns=patterns):
+            for match in matches:
+                results.append({
+                    'host': conn.get_host_info(),
+                    'database': database_name,
+                    'table': table,
+                    'column': column,
+                    'pattern_name': match['pattern_name'],
+                    'matches': match['matches'],
+                    'sample_text': match['sample_text'],
+                    'profile': profile_name,
+                    'data_source': 'mysql'
+                })
 
         table_count += 1
 
@@ -75,7 +75,7 @@ def execute(args):
         mysql_config = sources_config.get('mysql')
 
         if mysql_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for key, config in mysql_config.items():
                 host = config.get('host')
@@ -29,6 +29,7 @@ def check_data_patterns(args, conn, patterns, profile_name, database_name, limit
         tables_to_scan = [table for table in all_tables if table in whitelisted_tables]
     else:
         tables_to_scan = all_tables or []
+    tables_to_scan = [table for table in tables_to_scan if system.in_shard(args, 'postgresql', profile_name, database_name, table)]
 
     table_count = 1
 
@@ -41,27 +42,26 @@ def check_data_patterns(args, conn, patterns, profile_name, database_name, limit
         cursor.execute(f"SELECT * FROM {table} LIMIT {limit_end} OFFSET {limit_start}")
         columns = [column[0] for column in cursor.description]
 
-        data_count = 1
+        values, keys = [], []
         for row in cursor.fetchall():
             for column, value in zip(columns, row):
                 if value:
-                    value_str = str(value)
-                    matches = system.match_strings(args, value_str)
-                    if matches:
-                        for match in matches:
-                            results.append({
-                                'host': conn.dsn,
-                                'database': database_name,
-                                'table': table,
-                                'column': column,
-                                'pattern_name': match['pattern_name'],
-                                'matches': match['matches'],
-                                'sample_text': match['sample_text'],
-                                'profile': profile_name,
-                                'data_source': 'postgresql'
-                            })
-
-            data_count += 1
+                    values.append(str(value))
+                    keys.append(column)
+
+        for column, matches in system.match_batch(args, values, keys, patterns=patterns):
+            for match in matches:
+                results.append({
+                    'host': conn.dsn,
+                    'database': database_name,
+                    'table': table,
+                    'column': column,
+                    'pattern_name': match['pattern_name'],
+                    'matches': match['matches'],
+                    'sample_text': match['sample_text'],
+                    'profile': profile_name,
+                    'data_source': 'postgresql'
+                })
 
         table_count += 1
 
@@ -78,7 +78,7 @@ def execute(args):
         postgresql_config = sources_config.get('postgresql')
 
         if postgresql_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for key, config in postgresql_config.items():
                 host = config.get('host')
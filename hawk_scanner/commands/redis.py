@@ -22,26 +22,28 @@ def get_patterns_from_file(file_path):
         patterns = yaml.safe_load(file)
         return patterns
 
-def check_data_patterns(redis_instance, patterns, profile_name, host):
+def check_data_patterns(args, redis_instance, patterns, profile_name, host):
 
     results = []
-    keys = redis_instance.keys('*')
+    keys = [key for key in redis_instance.keys('*') if system.in_shard(args, 'redis', profile_name, host, key.decode('utf-8', errors='replace'))]
+    values, value_keys = [], []
     for key in keys:
         data = redis_instance.get(key)
         if data:
-            data_str = data.decode('utf-8')
-            matches = system.match_strings(args, data_str)
-            if matches:
-                for match in matches:
-                    results.append({
-                        'host': host,
-                        'key': key.decode('utf-8'),
-                        'pattern_name': match['pattern_name'],
-                        'matches': match['matches'],
-                        'sample_text': match['sample_text'],
-                        'profile': profile_name,
-                        'data_source': 'redis'
-                    })
+            values.append(data.decode('utf-8'))
+            value_keys.append(key)
+
+    for key, matches in system.match_batch(args, values, value_keys, patterns=patterns):
+        for match in matches:
+            results.append({
+                'host': host,
+                'key': key.decode('utf-8'),
+                'pattern_name': match['pattern_name'],
+                'matches': match['matches'],
+                'sample_text': match['sample_text'],
+                'profile': profile_name,
+                'data_source': 'redis'
+            })
     return results
 
 def execute(args):
@@ -53,7 +55,7 @@ def execute(args):
         redis_config = sources_config.get('redis')
 
         if redis_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for profile_name, config in redis_config.items():
                 host = config.get('host')
@@ -63,7 +65,7 @@ def execute(args):
                 if host:
                     redis_instance = connect_redis(args, host, port, password)
                     if redis_instance:
-                        results = check_data_patterns(redis_instance, patterns, profile_name, host)
+                        results = check_data_patterns(args, redis_instance, patterns, profile_name, host)
                         redis_instance.close()
                 else:
                     system.print_error(args, f"Incomplete Redis configuration for key: {profile_name}")
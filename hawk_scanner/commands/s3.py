@@ -69,6 +69,8 @@ def execute(args):
                             file_name = obj.key
                             if system.should_exclude_file(args, file_name, exclude_patterns):
                                 continue
+                            if not system.in_shard(args, 's3', key, bucket_name, file_name):
+                                continue
 
                             file_path = f"data/s3/{remote_etag}-{file_name}"
                             os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -92,7 +94,7 @@ def execute(args):
                             matches = system.read_match_strings(args, file_path, 'google_cloud_storage')
                             if matches:
                                 for match in matches:
-                                    results.append({
+                                    result = {
                                         'bucket': bucket_name,
                                         'file_path': file_name,
                                         'pattern_name': match['pattern_name'],
@@ -100,7 +102,8 @@ def execute(args):
                                         'sample_text': match['sample_text'],
                                         'profile': key,
                                         'data_source': 's3'
-                                    })
+                                    }
+                                    results.append(system.add_match_details(result, match))
 
                     else:
                         system.print_error(args, f"Failed to connect to S3 bucket: {bucket_name}")
@@ -142,6 +142,7 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
             filtered_channels.append(channel)  # Add the channel if it wasn't skipped
         if filtered_channels.__len__() > 0:
             channels = filtered_channels  # Update the original list
+        channels = [channel for channel in channels if system.in_shard(args, 'slack', profile_name, channel['id'])]
         # Optional: Print or log the total number of channels fetched
         system.print_info(args, f"Total channels to scan after filteration: {len(channels)}")
         system.print_info(args, f"Found {len(channels)} channels of type {channel_types}")
@@ -193,7 +194,10 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                     break  # Stop if there's no more data
 
             system.print_debug(args, f"Fetched {len(messages)} messages from {channel_name} ({channel_id})")
-            for message in messages:
+            # Match the text of all messages in batches instead of one by one
+            texts = [(index, message.get("text")) for index, message in enumerate(messages) if message.get("text")]
+            text_matches = dict(system.match_batch(args, [text for _, text in texts], [index for index, _ in texts], patterns=patterns))
+            for index, message in enumerate(messages):
                 if quick_exit and total_results >= max_matches:
                     system.print_info(args, f"Quick exit enabled. Found {max_matches} matches. Exiting...")
                     break
@@ -210,7 +214,7 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                         if matches:
                             for match in matches:
                                 total_results += 1
-                                results.append({
+                                results.append(system.add_match_details({
                                     'channel_id': channel_id,
                                     'channel_name': channel_name,
                                     'user': user,
@@ -220,11 +224,11 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                                     'profile': profile_name,
                                     'message_link': workspace_url + f"/archives/{channel_id}/p{message_ts.replace('.', '')}",
                                     'data_source': 'slack'
-                                })
+                                }, match))
 
                 # Check main message for matches
                 if text:
-                    matches = system.match_strings(args, text)
+                    matches = text_matches.get(index)
                     if matches:
                         for match in matches:
                             total_results += 1
@@ -243,7 +247,9 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                 if "thread_ts" in message:
                     thread_ts = message["thread_ts"]
                     replies = rate_limit_retry(client.conversations_replies, channel=channel_id, ts=thread_ts, oldest=oldest_time)["messages"]
-                    for reply in replies:
+                    reply_texts = [(reply_index, reply.get("text")) for reply_index, reply in enumerate(replies) if reply.get("text")]
+                    reply_text_matches = dict(system.match_batch(args, [text for _, text in reply_texts], [reply_index for reply_index, _ in reply_texts], patterns=patterns))
+                    for reply_index, reply in enumerate(replies):
                         if reply["ts"] != thread_ts:  # Skip the parent message
                             reply_user = reply.get("user", "")
                             reply_text = reply.get("text")
@@ -259,7 +265,7 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                                     if matches:
                                         for match in matches:
                                             total_results += 1
-                                            results.append({
+                                            results.append(system.add_match_details({
                                                 'channel_id': channel_id,
                                                 'channel_name': channel_name,
                                                 'user': reply_user,
@@ -269,10 +275,10 @@ def check_slack_messages(args, client, patterns, profile_name, channel_types, is
                                                 'profile': profile_name,
                                                 'message_link': workspace_url + f"/archives/{channel_id}/p{reply_ts.replace('.', '')}",
                                                 'data_source': 'slack'
-                                            })
+                                            }, match))
 
                             if reply_text:
-                                reply_matches = system.match_strings(args, reply_text)
+                                reply_matches = reply_text_matches.get(reply_index)
                                 if reply_matches:
                                     for match in reply_matches:
                                         total_results += 1
@@ -377,7 +383,7 @@ def execute(args):
         slack_config = sources_config.get('slack')
 
         if slack_config:
-            patterns = system.get_fingerprint_file(args)
+            patterns = system.get_pattern_set(args)
 
             for key, config in slack_config.items():
                 current_unix_timestamp = int(time.time())
@@ -5,7 +5,7 @@ console = Console()
 
 def check_data_patterns(args, value, patterns, profile_name):
     value_str = str(value)
-    matches = system.match_strings(args, value_str)
+    matches = system.match_strings(args, value_str, patterns=patterns)
     results = []
     if matches:
         for match in matches:
@@ -22,13 +22,15 @@ def execute(args):
     results = []
     system.print_info(args, f"Running Checks for Simple text")
     connections = system.get_connection(args)
-    patterns = system.get_fingerprint_file(args)
+    patterns = system.get_pattern_set(args)
     if 'sources' in connections:
         sources_config = connections['sources']
         text_config = sources_config.get('text')
 
         if text_config:
             for key, config in text_config.items():
+                if not system.in_shard(args, 'text', key):
+                    continue
                 text = config.get('text', None)
                 results += check_data_patterns(args, text, patterns, key)
         else:
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+INDEX_PATH = os.path.join('data', 'fs_index.db')
+## bump when the way files are read or matched changes, so findings of older runs are not reused
+INDEX_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+COMMIT_EVERY = 1000
+
+def hash_file(file_path):
+    digest = hashlib.blake2b()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fingerprint_digest(pattern_set):
+    """
+    Digest of everything the findings of a file depend on besides its content.
+
+    :param pattern_set: The PatternSet of the run.
+    :return: Hex digest of the fingerprints, the redaction setting and INDEX_VERSION.
+    """
+    payload = json.dumps([INDEX_VERSION, pattern_set.patterns, pattern_set.redacted], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def stat_key(stat):
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+class FileIndex:
+    """
+    SQLite index of the files scanned by previous `fs` runs, keyed by path.
+
+    Each row keeps the inode, size and mtime of the file, the hash of its content and its
+    findings. A file whose stat fields did not change is not read at all, one whose stat
+    fields changed but whose content hash did not is not scanned again. The whole index is
+    dropped when the fingerprints or the redaction setting change.
+
+    The index is not thread safe, it is only used by the thread collecting the results.
+
+    :param path: Path of the SQLite database, created with its directory when missing.
+    :param digest: fingerprint_digest() of the run.
+    """
+
+    def __init__(self, path, digest):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime INTEGER, hash TEXT, findings TEXT)')
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if not row or row[0] != digest:
+            self.connection.execute('DELETE FROM files')
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (digest,))
+        self.connection.commit()
+        self.changes = 0
+
+    def get(self, file_path):
+        """
+        :return: (stat key, content hash, findings) of the file, or None when it was never indexed.
+        """
+        row = self.connection.execute('SELECT inode, size, mtime, hash, findings FROM files WHERE path = ?', (file_path,)).fetchone()
+        if row is None:
+            return None
+        return tuple(row[:3]), row[3], json.loads(row[4])
+
+    def update(self, file_path, stat, content_hash, findings):
+        """
+        Store the stat fields, content hash and findings of a scanned file.
+
+        :param findings: JSON serializable findings, reported again while the file does not change.
+        """
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                (file_path, *stat_key(stat), content_hash, json.dumps(findings)))
+        self._changed()
+
+    def touch(self, file_path, stat):
+        ## same content under new stat fields (touched, copied back, moved to another inode)
+        self.connection.execute('UPDATE files SET inode = ?, size = ?, mtime = ? WHERE path = ?', (*stat_key(stat), file_path))
+        self._changed()
+
+    def _changed(self):
+        self.changes += 1
+        if self.changes % COMMIT_EVERY == 0:
+            self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,885 @@
+import bisect
+import importlib
+import re
+import threading
+import time
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+## the optional engines are imported on first use, loading them costs more than the rest of the CLI start-up
+_optional_modules = {}
+
+
+def _optional_module(name):
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+
+def load_re2():
+    re2 = _optional_module('re2')
+    return re2 if re2 and hasattr(re2, 'Set') else None
+
+
+def load_ahocorasick():
+    return _optional_module('ahocorasick')
+
+
+def load_timed_re():
+    ## drop-in `re` replacement whose searches take a timeout, used for match time budgets
+    return _optional_module('regex')
+
+
+ENGINES = ('re2', 'loop')
+
+## escapes whose meaning depends on Unicode in Python but is ASCII-only in RE2
+_UNICODE_CLASSES = re.compile(r'\\[dDwWsSbB]')
+## non-ASCII characters `re` folds onto ASCII letters under IGNORECASE: İ, ı, ſ and the Kelvin sign
+_ASCII_FOLDS = re.compile('[\u0130\u0131\u017f\u212a]')
+
+
+## shortest literal worth prefiltering on, shorter ones occur in almost any text
+MIN_ANCHOR_LENGTH = 3
+## below this size running the regexes is cheaper than the prefilter pass
+PREFILTER_MIN_LENGTH = 256
+## longest match assumed for unbounded patterns like `[a-z]+@...` when chunks overlap
+MAX_UNBOUNDED_SPAN = 4096
+## characters kept in front of each chunk so \b and lookbehinds see what precedes it
+STREAM_CONTEXT = 64
+## upper bound on the alternatives tracked per anchor, e.g. (AKIA|ASIA|...)
+MAX_ANCHOR_ALTERNATIVES = 64
+## joins the values of a batch; a non-word character, so \b sees the ends of a value as it would on its own
+BATCH_SEPARATOR = '\n'
+## bytes `re` and str `re` disagree on these: non-ASCII bytes, and \x1c-\x1f which str \s matches
+_NON_PLAIN_BYTES = re.compile(rb'[\x1c-\x1f\x80-\xff]')
+
+
+def default_engine():
+    return 're2' if load_re2() else 'loop'
+
+
+def is_plain_bytes(buffer):
+    """
+    Whether bytes regexes match a buffer exactly like str regexes match its decoded text,
+    which holds when the buffer is ASCII without the separator control characters.
+
+    :param buffer: bytes, mmap or any other object supporting the buffer protocol.
+    """
+    return _NON_PLAIN_BYTES.search(buffer) is None
+
+
+def _concat(left, right):
+    joined = {a + b for a in left for b in right}
+    return joined if len(joined) <= MAX_ANCHOR_ALTERNATIVES else None
+
+
+def _score(literals):
+    return (min(len(literal) for literal in literals), -len(literals))
+
+
+def _analyze_sequence(parsed):
+    """
+    Work out which literal strings a parsed regex needs.
+
+    :return: Tuple of (exact, prefix, suffix, required). `exact` is the set of strings the
+             sequence can only ever match (or None), `prefix`/`suffix` the strings every match
+             starts/ends with, and `required` the best set of strings one of which must appear.
+    """
+    candidates = []
+    run = {''}
+    prefix = None
+    exact = True
+    for op, av in parsed:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            ## zero-width, the literals on both sides stay adjacent
+            continue
+        item_exact, item_prefix, item_suffix, item_required = _analyze_item(op, av)
+        if item_exact is not None:
+            joined = _concat(run, item_exact)
+            if joined is None:
+                candidates.append(run)
+                joined = set(item_exact)
+                exact = False
+                if prefix is None:
+                    prefix = run
+            run = joined
+            continue
+
+        joined = _concat(run, item_prefix) or set(item_prefix)
+        candidates.append(joined)
+        if prefix is None:
+            prefix = joined
+        if item_required:
+            candidates.append(item_required)
+        run = set(item_suffix)
+        exact = False
+    candidates.append(run)
+
+    candidates = [c for c in candidates if c and '' not in c]
+    required = max(candidates, key=_score) if candidates else None
+    if exact:
+        return run, run, run, required
+    return None, prefix, run, required
+
+
+def _analyze_item(op, av):
+    unknown = (None, {''}, {''}, None)
+    if op == sre_parse.LITERAL:
+        literal = {chr(av)}
+        return literal, literal, literal, literal
+    if op == sre_parse.IN:
+        if 0 < len(av) <= 4 and all(item_op == sre_parse.LITERAL for item_op, _ in av):
+            literal = {chr(value) for _, value in av}
+            return literal, literal, literal, None
+        return unknown
+    if op == sre_parse.SUBPATTERN:
+        return _analyze_sequence(av[-1])
+    if op == sre_parse.BRANCH:
+        branches = [_analyze_sequence(branch) for branch in av[1]]
+        if all(branch[0] is not None for branch in branches):
+            literal = set().union(*(branch[0] for branch in branches))
+            if len(literal) <= MAX_ANCHOR_ALTERNATIVES:
+                return literal, literal, literal, literal
+        prefix = set().union(*(branch[1] for branch in branches))
+        suffix = set().union(*(branch[2] for branch in branches))
+        required = None
+        if all(branch[0] or branch[3] for branch in branches):
+            required = set().union(*(branch[0] or branch[3] for branch in branches))
+            if len(required) > MAX_ANCHOR_ALTERNATIVES:
+                required = None
+        return None, prefix, suffix, required
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+        low, high, item = av
+        inner = _analyze_sequence(item)
+        if low == high == 1:
+            return inner
+        if low >= 1:
+            return None, inner[1], inner[2], inner[0] or inner[3]
+    return unknown
+
+
+def extract_anchors(regex):
+    """
+    Literal strings one of which has to appear in any text the regex matches,
+    for example {'akia', 'asia', 'a3t', ...} for the AWS access key pattern.
+
+    :return: Case-folded anchors, or None when the regex has no usable literal.
+    """
+    try:
+        parsed = sre_parse.parse(regex, re.IGNORECASE)
+    except re.error:
+        return None
+    required = _analyze_sequence(parsed)[3]
+    if not required or min(len(literal) for literal in required) < MIN_ANCHOR_LENGTH:
+        return None
+    return {literal.casefold() for literal in required}
+
+
+## characters the backtracking lint checks character classes against
+_LINT_ALPHABET = frozenset(chr(c) for c in range(9, 127))
+_LINT_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: r'\d', sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s', sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w', sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+## runs this long over (nearly) any character make every attempt scan that far
+WIDE_RUN_LENGTH = 100
+
+
+def _char_set(op, av):
+    """
+    Characters of `_LINT_ALPHABET` a single-character item matches, case-insensitively, or None.
+    """
+    if op == sre_parse.ANY:
+        return _LINT_ALPHABET - {'\n'}
+    if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL):
+        chars = {chr(av).lower(), chr(av).upper()}
+        return chars if op == sre_parse.LITERAL else _LINT_ALPHABET - chars
+    if op == sre_parse.IN:
+        negate = False
+        chars = set()
+        for item_op, item_av in av:
+            if item_op == sre_parse.NEGATE:
+                negate = True
+            elif item_op == sre_parse.LITERAL:
+                chars.add(chr(item_av))
+            elif item_op == sre_parse.RANGE:
+                chars |= {c for c in _LINT_ALPHABET if item_av[0] <= ord(c) <= item_av[1]}
+            elif item_op == sre_parse.CATEGORY and item_av in _LINT_CATEGORIES:
+                chars |= {c for c in _LINT_ALPHABET if re.match(_LINT_CATEGORIES[item_av], c)}
+            else:
+                return None
+        chars |= {c.swapcase() for c in chars}
+        return _LINT_ALPHABET - chars if negate else chars & _LINT_ALPHABET
+    return None
+
+
+def _run(op, av):
+    """
+    (characters, min, max) when the item is a run of single characters, like `.{0,20}` or `(.{0,20})?`.
+    """
+    if op == sre_parse.SUBPATTERN and len(av[-1]) == 1:
+        return _run(*av[-1][0])
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and len(av[2]) == 1:
+        inner = _run(*av[2][0])
+        if inner is None:
+            return None
+        chars, low, high = inner
+        if sre_parse.MAXREPEAT in (high, av[1]):
+            return chars, low * av[0], sre_parse.MAXREPEAT
+        return chars, low * av[0], high * av[1]
+    chars = _char_set(op, av)
+    return None if chars is None else (chars, 1, 1)
+
+
+def _length(run):
+    _, low, high = run
+    if high == sre_parse.MAXREPEAT:
+        return f'{low} or more'
+    return str(high) if low == high else f'{low} to {high}'
+
+
+def _sequences(parsed):
+    yield parsed
+    for op, av in _walk(parsed):
+        items = av if isinstance(av, (list, tuple)) else [av]
+        for item in items:
+            subs = item if isinstance(item, (list, tuple)) else [item]
+            for sub in subs:
+                if isinstance(sub, sre_parse.SubPattern):
+                    yield sub
+
+
+def lint_regex(regex):
+    """
+    Look for the shapes that make a backtracking engine slow on unlucky input: quantifiers
+    nested in quantifiers, runs followed by a run of overlapping characters (every split
+    between them is tried), and long runs of almost any character.
+
+    :return: List of human-readable warnings, empty when nothing was found.
+    """
+    try:
+        parsed = sre_parse.parse(regex, re.IGNORECASE)
+    except re.error:
+        return []
+    warnings = []
+    for op, av in _walk(parsed):
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] != av[1] and av[1] > 1:
+            for inner_op, inner_av in _walk(av[2]):
+                if inner_op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and inner_av[1] == sre_parse.MAXREPEAT:
+                    warnings.append('a repeated group contains an unbounded quantifier, which can backtrack exponentially')
+                    break
+
+    for sequence in _sequences(parsed):
+        runs = [_run(op, av) for op, av in sequence]
+        for run, following in zip(runs, runs[1:]):
+            if run and following and run[1] != run[2] and following[2] > 1 and run[0] & following[0]:
+                warnings.append(f'a run of {_length(run)} characters is followed by a run of {_length(following)} '
+                                'overlapping characters, every split between them is tried')
+        for run in runs:
+            if run and run[2] >= WIDE_RUN_LENGTH and len(run[0]) >= 0.9 * len(_LINT_ALPHABET):
+                warnings.append(f'a run of {_length(run)} characters matches almost anything, each attempt can scan that far')
+    return list(dict.fromkeys(warnings))
+
+
+class AnchorPrefilter:
+    """
+    Finds which anchors occur in a text in one pass, with an Aho-Corasick automaton
+    when pyahocorasick is installed and with a single literal alternation otherwise.
+    """
+
+    def __init__(self, anchors):
+        self.anchors = set(anchors)
+        ## an anchor found in the text also means every anchor inside it was found
+        self.closure = {anchor: {other for other in self.anchors if other in anchor} for anchor in self.anchors}
+        self.automaton = None
+        self.regex = None
+        self.bytes_regex = None
+        ahocorasick = load_ahocorasick()
+        if ahocorasick:
+            self.automaton = ahocorasick.Automaton()
+            for anchor in self.anchors:
+                self.automaton.add_word(anchor, anchor)
+            self.automaton.make_automaton()
+        else:
+            ## longest first, so the anchor reported at a position contains all others starting there
+            alternatives = sorted(self.anchors, key=len, reverse=True)
+            self.regex = re.compile('|'.join(re.escape(anchor) for anchor in alternatives), re.IGNORECASE)
+
+    def found(self, content):
+        """
+        :param content: Text, or a plain ASCII buffer (see `is_plain_bytes`).
+        :return: Set of anchors present in the content, or None if that cannot be told.
+        """
+        seen = set()
+        regex = self.regex
+        if not isinstance(content, str):
+            if self.bytes_regex is None:
+                alternatives = sorted(self.anchors, key=len, reverse=True)
+                self.bytes_regex = re.compile(b'|'.join(re.escape(anchor.encode('utf-8')) for anchor in alternatives), re.IGNORECASE)
+            regex = self.bytes_regex
+        elif not content.isascii() and _ASCII_FOLDS.search(content):
+            ## casefold() turns İ into i and a combining dot and keeps ı, `re` matches both as i
+            return None
+        elif self.automaton is not None:
+            folded = content if content.isascii() and content.islower() else content.casefold()
+            for _, anchor in self.automaton.iter(folded):
+                seen |= self.closure[anchor]
+                if len(seen) == len(self.anchors):
+                    break
+            return seen
+
+        pos = 0
+        while len(seen) < len(self.anchors):
+            match = regex.search(content, pos)
+            if not match:
+                break
+            anchor = match.group()
+            anchor = (anchor if isinstance(anchor, str) else anchor.decode('ascii')).casefold()
+            if anchor not in self.closure:
+                return None
+            seen |= self.closure[anchor]
+            ## step one character so anchors overlapping this one are found too
+            pos = match.start() + 1
+        return seen
+
+
+class PatternStats:
+    """
+    Cumulative cost of each fingerprint: seconds spent running it, size of the content it ran
+    over (characters of text, bytes of memory-mapped files), number of evaluations and of
+    matches, and how often it ran out of its time budget. Fingerprints sharing a regex are
+    evaluated once and share their counters. Skipped evaluations (prefilter, RE2 screen) are
+    not counted, so the report shows what each fingerprint actually costs.
+    """
+
+    FIELDS = ('seconds', 'bytes', 'evaluations', 'hits', 'timeouts')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def record(self, entry, seconds, size, hits, timeouts=0):
+        with self.lock:
+            for name in entry.names:
+                counters = self.counters.setdefault(name, [0, 0, 0, 0, 0])
+                counters[0] += seconds
+                counters[1] += size
+                counters[2] += 1
+                counters[3] += hits
+                counters[4] += timeouts
+
+    def take(self):
+        """
+        :return: The counters so far, as a plain dict that can be sent between processes, and reset them.
+        """
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def merge(self, counters):
+        """
+        Add the counters taken from another PatternStats, e.g. one of a worker process.
+        """
+        with self.lock:
+            for name, values in counters.items():
+                totals = self.counters.setdefault(name, [0, 0, 0, 0, 0])
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+    def report(self):
+        """
+        :return: One dict per fingerprint with its counters, the most expensive first.
+        """
+        with self.lock:
+            rows = [dict(pattern_name=name, **dict(zip(self.FIELDS, values))) for name, values in self.counters.items()]
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+
+class PatternEntry:
+    """
+    A single unique regex from the fingerprint file.
+
+    Several fingerprint names can share the same regex (for example
+    `AWS Access Key ID` and `AWS Access Key ID Value`), in which case the
+    regex is compiled and evaluated once and the hits are reported under
+    every name.
+    """
+
+    def __init__(self, regex, names, module=re):
+        self.regex = regex
+        self.names = names
+        self.module = module
+        self.compiled = self._compile(regex)
+        self.unicode_sensitive = bool(_UNICODE_CLASSES.search(regex))
+        self.anchors = extract_anchors(regex)
+        ## every match holds one of the anchors, so it cannot match text without letters when they all have one
+        self.needs_letter = bool(self.anchors) and all(any(char.isalpha() for char in anchor) for anchor in self.anchors)
+        parsed = sre_parse.parse(regex, re.IGNORECASE)
+        self.span = min(parsed.getwidth()[1], MAX_UNBOUNDED_SPAN)
+        ## whether the regex matches a value the same way inside a batch of joined values, which
+        ## does not hold for ^, $ and lookarounds, nor for empty matches at the separators
+        self.batchable = parsed.getwidth()[0] > 0 and not _has_context_assertion(parsed)
+        self._bytes_compiled = False
+
+    @property
+    def bytes_compiled(self):
+        """
+        The regex compiled for bytes, or None when it only makes sense for text (e.g. `\\u` escapes).
+        """
+        if self._bytes_compiled is False:
+            try:
+                self._bytes_compiled = self._compile(self.regex.encode('utf-8'))
+            except self.module.error:
+                self._bytes_compiled = None
+        return self._bytes_compiled
+
+    def _compile(self, regex):
+        if self.module is re:
+            return re.compile(regex, re.IGNORECASE)
+        return self.module.compile(regex, self.module.IGNORECASE | self.module.VERSION0)
+
+    def finditer(self, content, pos=0, timeout=None, expired=None):
+        """
+        Iterate over the matches in text or in a plain bytes buffer.
+
+        :param timeout: Seconds the whole iteration may take, needs the entry to be compiled with
+                        the regex package. Once over, the iteration stops early and the entry is
+                        added to `expired`; the matches found until then are still yielded.
+        """
+        compiled = self.compiled if isinstance(content, str) else self.bytes_compiled
+        if timeout is None:
+            yield from compiled.finditer(content, pos)
+            return
+        try:
+            yield from compiled.finditer(content, pos, timeout=timeout)
+        except TimeoutError:
+            expired.add(self)
+
+    def findall(self, content, timeout=None, expired=None):
+        """
+        `re.findall` over the content, within the timeout if one is given (see `finditer`).
+        """
+        if timeout is None:
+            return self.compiled.findall(content)
+        return [self.result(match) for match in self.finditer(content, 0, timeout, expired)]
+
+    def result(self, match):
+        """
+        Same shape `re.findall` returns for a match: the whole match, the single group, or a tuple of groups.
+        Matches over plain bytes are decoded, so they look the same as matches over text.
+        """
+        groups = self.compiled.groups
+        if groups == 0:
+            return _text(match.group())
+        if groups == 1:
+            return _text(match.group(1) or '')
+        return tuple(_text(group or '') for group in match.groups())
+
+    def re2_compatible(self):
+        """
+        Whether RE2 reads the regex the same way `re` does. `$` also matches before a
+        trailing newline in `re`, and `[[:alpha:]]` is a POSIX class only in RE2.
+        """
+        if '[:' in self.regex:
+            return False
+        try:
+            parsed = sre_parse.parse(self.regex, re.IGNORECASE)
+        except re.error:
+            return False
+        return not _has_end_anchor(parsed)
+
+
+def _text(value):
+    return value if isinstance(value, str) else value.decode('ascii')
+
+
+def _walk(parsed):
+    """
+    Every (op, av) node of a parsed regex, including those nested in groups, branches and repeats.
+    """
+    for op, av in parsed:
+        yield op, av
+        items = av if isinstance(av, (list, tuple)) else [av]
+        for item in items:
+            subs = item if isinstance(item, (list, tuple)) else [item]
+            for sub in subs:
+                if isinstance(sub, sre_parse.SubPattern):
+                    yield from _walk(sub)
+
+
+def _has_end_anchor(parsed):
+    return any(op == sre_parse.AT and av == sre_parse.AT_END for op, av in _walk(parsed))
+
+
+def _has_context_assertion(parsed):
+    for op, av in _walk(parsed):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return True
+        if op == sre_parse.AT and av not in (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY):
+            return True
+    return False
+
+
+class PatternSet:
+    """
+    Compiled fingerprints shared by every source during a run.
+
+    With the `re2` engine (needs the optional google-re2 package) every
+    fingerprint RE2 understands is compiled into one RE2::Set automaton,
+    which finds all patterns present in the content in a single pass. Only
+    the patterns it reports are then run with `re`, so the results are
+    exactly what `re.findall` returns per pattern. Patterns RE2 cannot
+    compile (lookarounds, backreferences) are always run with `re`. The
+    `loop` engine is the pure-Python fallback that runs every pattern.
+
+    Patterns that are not in the automaton go through a literal prefilter
+    first: required literals such as `AKIA`, `xoxb-` or `hooks.slack.com`
+    are extracted from each regex when the set is built, and a regex is only
+    run when one of its literals occurs in the content. Patterns without a
+    literal (Email, Aadhar, ...) always run.
+
+    :param patterns: Mapping of pattern name to regex, as loaded from fingerprint.yml.
+    :param redacted: Whether matches should be redacted before they are reported.
+    :param engine: `re2` or `loop`, defaults to `re2` when google-re2 is installed.
+    :param prefilter: Whether to skip regexes whose literals do not occur in the content.
+    :param timeout: Seconds each regex may spend on one item (value, message, file) before it is
+                    given up for that item and reported as timed out. Needs the optional regex
+                    package, without it no budget is enforced.
+    :param stats: Whether to count what each fingerprint costs, see PatternStats.
+    """
+
+    def __init__(self, patterns, redacted=False, engine=None, prefilter=True, timeout=None, stats=False):
+        self.patterns = dict(patterns or {})
+        self.redacted = redacted
+        self.engine = engine if engine in ENGINES else default_engine()
+        if self.engine == 're2' and not load_re2():
+            self.engine = 'loop'
+        self.timeout = timeout if timeout and load_timed_re() else None
+        self.stats = PatternStats() if stats else None
+        self.entries = []
+
+        by_regex = {}
+        for pattern_name, pattern_regex in self.patterns.items():
+            entry = by_regex.get(pattern_regex)
+            if entry:
+                entry.names.append(pattern_name)
+                continue
+            entry = self._entry(pattern_regex, [pattern_name])
+            by_regex[pattern_regex] = entry
+            self.entries.append(entry)
+
+        ## report hits in the same order as the fingerprint file
+        self.order = {name: i for i, name in enumerate(self.patterns)}
+
+        self.automaton = None
+        self.automaton_entries = []
+        self.standalone = list(self.entries)
+        if self.engine == 're2':
+            self._build_automaton()
+
+        self.prefilter = None
+        anchors = set()
+        for entry in self.standalone:
+            anchors |= entry.anchors or set()
+        if prefilter and anchors:
+            self.prefilter = AnchorPrefilter(anchors)
+
+        ## chunks overlap by the longest possible match, so no match is cut at a chunk boundary
+        self.max_span = max((entry.span for entry in self.entries), default=0) + 1
+        self._letter_free = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def letter_free(self):
+        """
+        The fingerprints that can match text without any letter (numbers, dates, phone or card
+        numbers), to run over letter-free values such as numeric spreadsheet cells instead of
+        the whole set. They share the stats of this set.
+
+        :return: A PatternSet, built on first use.
+        """
+        if self._letter_free is None:
+            needs_letter = {entry.regex for entry in self.entries if entry.needs_letter}
+            patterns = {name: regex for name, regex in self.patterns.items() if regex not in needs_letter}
+            letter_free = PatternSet(patterns, redacted=self.redacted, engine=self.engine, timeout=self.timeout)
+            letter_free.stats = self.stats
+            self._letter_free = letter_free
+        return self._letter_free
+
+    def _entry(self, regex, names):
+        if self.timeout is not None:
+            timed_re = load_timed_re()
+            try:
+                return PatternEntry(regex, names, timed_re)
+            except timed_re.error:
+                ## the few regexes only `re` understands run without a budget
+                pass
+        return PatternEntry(regex, names)
+
+    @staticmethod
+    def _expired_names(expired):
+        return [name for entry in expired for name in entry.names]
+
+    def _build_automaton(self):
+        re2 = load_re2()
+        options = re2.Options()
+        options.case_sensitive = False
+        options.log_errors = False
+        ## a bigger DFA budget keeps the single pass from bailing out on large fingerprint sets
+        options.max_mem = 64 << 20
+        automaton = re2.Set.SearchSet(options)
+        added = []
+        for entry in self.entries:
+            if not entry.re2_compatible():
+                continue
+            try:
+                automaton.Add(entry.regex)
+            except re2.error:
+                continue
+            added.append(entry)
+        if not added:
+            self.engine = 'loop'
+            return
+        try:
+            automaton.Compile()
+        except re2.error:
+            self.engine = 'loop'
+            return
+        self.automaton = automaton
+        self.automaton_entries = added
+        self.standalone = [entry for entry in self.entries if entry not in added]
+
+    def _candidates(self, content):
+        """
+        Entries that have to be run with `re` for this content.
+        """
+        candidates = self.standalone
+        if self.prefilter is not None and len(content) >= PREFILTER_MIN_LENGTH:
+            seen = self.prefilter.found(content)
+            if seen is not None:
+                candidates = [entry for entry in candidates if entry.anchors is None or entry.anchors & seen]
+
+        if self.automaton is None:
+            return candidates
+
+        hits = self.automaton.Match(content) or []
+        candidates = list(candidates)
+        if not isinstance(content, str) or content.isascii():
+            candidates += [self.automaton_entries[i] for i in sorted(hits)]
+        elif _ASCII_FOLDS.search(content):
+            ## `[A-Z]` matches these under IGNORECASE in `re` but not all of them in RE2
+            candidates += self.automaton_entries
+        else:
+            ## RE2 classes like \d and \b are ASCII-only, so they cannot rule out a Unicode hit
+            hits = set(hits)
+            candidates += [entry for i, entry in enumerate(self.automaton_entries) if i in hits or entry.unicode_sensitive]
+        return candidates
+
+    def findall(self, content, timed_out=None):
+        """
+        Run the fingerprints over the content.
+
+        :param content: Text to scan.
+        :param timed_out: Optional list, the names of the patterns that ran out of time are added to it.
+        :return: Dict of pattern name to the `re.findall` result, for patterns with hits only.
+        """
+        found = {}
+        expired = set()
+        stats = self.stats
+        for entry in self._candidates(content):
+            if stats is not None:
+                started = time.perf_counter()
+            if self.timeout is None:
+                matches = entry.compiled.findall(content)
+            else:
+                matches = entry.findall(content, self.timeout, expired)
+            if stats is not None:
+                stats.record(entry, time.perf_counter() - started, len(content), len(matches), entry in expired)
+            if matches:
+                for name in entry.names:
+                    found[name] = list(matches)
+        if timed_out is not None:
+            timed_out += self._expired_names(expired)
+        return dict(sorted(found.items(), key=lambda item: self.order[item[0]]))
+
+    def findall_batch(self, values, timed_out=None):
+        """
+        Run the fingerprints over many small values (DB cells, messages) at once.
+
+        The values are joined with `BATCH_SEPARATOR` into one buffer, so the prefilter,
+        the RE2 screen and each regex run once per batch instead of once per value. Every
+        match is mapped back to the value it lies in. A value that a match runs across
+        the separator of is matched again on its own, and so are the regexes that depend
+        on where a value starts or ends, so the results are exactly what `findall` returns
+        for each value.
+
+        :param values: List of strings.
+        :param timed_out: Optional list, an (index, pattern name) pair is added to it for each value
+                          a pattern ran out of time on. When a regex runs out of time on the whole
+                          batch, it is run again on every value with its own budget.
+        :return: List with the `findall` result for each value, in the same order.
+        """
+        results = [{} for _ in values]
+        if not values:
+            return results
+        starts = []
+        position = 0
+        for value in values:
+            starts.append(position)
+            position += len(value) + len(BATCH_SEPARATOR)
+        content = BATCH_SEPARATOR.join(values)
+
+        candidates = self._candidates(content)
+        ## the screen ran over the whole batch, where ^ only matches at the start of the first value
+        candidates = candidates + [entry for entry in self.automaton_entries if not entry.batchable and entry not in candidates]
+        stats = self.stats
+        for entry in candidates:
+            found = {}
+            expired = set()
+            if entry.batchable:
+                crossed = set()
+                hits = 0
+                if stats is not None:
+                    started = time.perf_counter()
+                for match in entry.finditer(content, 0, self.timeout, expired):
+                    hits += 1
+                    first = bisect.bisect_right(starts, match.start()) - 1
+                    last = bisect.bisect_right(starts, match.end() - 1) - 1
+                    if first != last or match.end() > starts[first] + len(values[first]):
+                        crossed.update(range(first, last + 1))
+                        continue
+                    found.setdefault(first, []).append(entry.result(match))
+                if stats is not None:
+                    stats.record(entry, time.perf_counter() - started, len(content), hits, len(expired))
+            if entry.batchable and not expired:
+                rerun = crossed
+            else:
+                found = {}
+                rerun = range(len(values))
+            for index in rerun:
+                expired = set()
+                if stats is not None:
+                    started = time.perf_counter()
+                found[index] = entry.findall(values[index], self.timeout, expired)
+                if stats is not None:
+                    stats.record(entry, time.perf_counter() - started, len(values[index]), len(found[index]), len(expired))
+                if expired and timed_out is not None:
+                    timed_out += [(index, name) for name in entry.names]
+            for index, matches in found.items():
+                if matches:
+                    for name in entry.names:
+                        results[index][name] = list(matches)
+        return [dict(sorted(found.items(), key=lambda item: self.order[item[0]])) for found in results]
+
+    def supports_bytes(self):
+        """
+        Whether every fingerprint can also be run over bytes, see `findall_buffer`.
+        """
+        return all(entry.bytes_compiled is not None for entry in self.entries)
+
+    def findall_buffer(self, buffer, timed_out=None):
+        """
+        Run the fingerprints directly over a bytes buffer such as a memory-mapped file,
+        without decoding it into a str copy first. Only the matches are decoded.
+
+        The buffer has to pass `is_plain_bytes`, for which the bytes regexes match exactly
+        what the str regexes match in the decoded text.
+
+        :param buffer: bytes, mmap or any other object supporting the buffer protocol.
+        :param timed_out: Optional list, the names of the patterns that ran out of time are added to it.
+        :return: Tuple of (dict of pattern name to unique matches, first 50 characters of the buffer).
+        """
+        results = {}
+        expired = set()
+        for entry in self._candidates(buffer):
+            started = time.perf_counter()
+            matches = [entry.result(match) for match in entry.finditer(buffer, 0, self.timeout, expired)]
+            if self.stats is not None:
+                self.stats.record(entry, time.perf_counter() - started, len(buffer), len(matches), entry in expired)
+            matches = dict.fromkeys(matches)
+            if matches:
+                for name in entry.names:
+                    results[name] = list(matches)
+        if timed_out is not None:
+            timed_out += self._expired_names(expired)
+        sample_text = bytes(buffer[:50]).decode('ascii')
+        return dict(sorted(results.items(), key=lambda item: self.order[item[0]])), sample_text
+
+    def findall_stream(self, stream, chunk_size=8 * 1024 * 1024, timed_out=None):
+        """
+        Run the fingerprints over a text stream in fixed-size chunks, keeping memory bounded
+        by the chunk size instead of the stream size.
+
+        Consecutive chunks overlap by the longest match any fingerprint can produce, and a
+        match is only taken from the chunk it starts in. Each pattern resumes after its
+        previous match, so the matches are the same as `re.findall` over the whole text.
+        Repeated matches are only kept once, as they are deduplicated when reported anyway.
+
+        :param stream: Text file object (or anything with `read(size)`).
+        :param chunk_size: Number of characters read at a time.
+        :param timed_out: Optional list, the names of the patterns that ran out of time are added to it.
+                          The time budget of a pattern covers the whole stream, not each chunk.
+        :return: Tuple of (dict of pattern name to unique matches, first 50 characters of the stream).
+        """
+        found = {}
+        last_end = {}
+        spent = {}
+        expired = set()
+        sample_text = ''
+        buffer = ''
+        base = 0
+        owned_start = 0
+        eof = False
+        while not eof:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            if len(sample_text) < 50:
+                sample_text += chunk[:50 - len(sample_text)]
+            buffer += chunk
+            owned_end = len(buffer) if eof else len(buffer) - self.max_span
+            if owned_end <= owned_start - base:
+                continue
+
+            for entry in self._candidates(buffer):
+                start = max(owned_start, last_end.get(entry, 0)) - base
+                if start > len(buffer) or entry in expired:
+                    continue
+                timeout = None
+                if self.timeout is not None:
+                    timeout = self.timeout - spent.get(entry, 0)
+                    if timeout <= 0:
+                        expired.add(entry)
+                        continue
+                started = time.perf_counter()
+                hits = 0
+                for match in entry.finditer(buffer, start, timeout, expired):
+                    if match.start() >= owned_end:
+                        break
+                    found.setdefault(entry, {})[entry.result(match)] = None
+                    last_end[entry] = base + match.end()
+                    hits += 1
+                elapsed = time.perf_counter() - started
+                spent[entry] = spent.get(entry, 0) + elapsed
+                if self.stats is not None:
+                    self.stats.record(entry, elapsed, len(buffer) - start, hits, entry in expired)
+
+            owned_start = base + owned_end
+            keep = max(0, owned_end - STREAM_CONTEXT)
+            buffer = buffer[keep:]
+            base += keep
+
+        results = {}
+        for entry, matches in found.items():
+            for name in entry.names:
+                results[name] = list(matches)
+        if timed_out is not None:
+            timed_out += self._expired_names(expired)
+        return dict(sorted(results.items(), key=lambda item: self.order[item[0]])), sample_text
@@ -1,31 +1,43 @@
-import jmespath
 from rich.console import Console 
-from rich.table import Table
-import json, requests, argparse, yaml, re, datetime, os, subprocess, platform, hashlib
-from tinydb import TinyDB, Query
-import numpy as np
-import pytesseract
-from PIL import Image, ImageEnhance
-from docx import Document
-from openpyxl import load_workbook
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import PyPDF2
-import patoolib
+import json, argparse, yaml, re, datetime, os, subprocess, platform, hashlib, fnmatch, functools, random, zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import tempfile
+import sqlite3
 import shutil
-import os, cv2
 import tarfile
-import pkg_resources
+import appdirs
+import threading
+import mmap
 from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hawk_scanner.internals.matcher import PatternSet, is_plain_bytes, lint_regex, load_timed_re
+from hawk_scanner.internals import file_index, text_cache
+
+## Extractor (cv2, numpy, pytesseract, PIL, docx, openpyxl, PyPDF2, patoolib) and notification
+## (requests, tinydb, jmespath) dependencies are imported by the functions using them, they take
+## most of the startup time and a text or database scan never needs them.
 
 
 data_sources = ['s3', 'mysql', 'redis', 'firebase', 'gcs', 'fs', 'postgresql', 'mongodb', 'slack', 'couchdb', 'gdrive', 'gdrive_workspace', 'text']
 data_sources_option = ['all'] + data_sources
 
+def get_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        ## Python 3.7
+        import pkg_resources
+        return pkg_resources.require("hawk_scanner")[0].version
+    try:
+        return version("hawk_scanner")
+    except PackageNotFoundError:
+        return 'unknown'
+
 def parse_args(args=None):
-    version = pkg_resources.require("hawk_scanner")[0].version 
+    version = get_version()
     parser = argparse.ArgumentParser(description='🦅 A powerful scanner to scan your Filesystem, S3, MySQL, PostgreSQL, MongoDB, Redis, Google Cloud Storage and Firebase storage for PII and sensitive data.')
-    parser.add_argument('command', nargs='?', choices=data_sources_option, help='Command to execute')
+    parser.add_argument('command', nargs='?', choices=data_sources_option + ['merge'], help='Command to execute, merge combines the JSON outputs of --shard runs')
+    parser.add_argument('inputs', nargs='*', help='JSON outputs to combine, for the merge command')
     parser.add_argument('--connection', action='store', help='YAML Connection file path')
     parser.add_argument('--connection-json', type=str, help='Connection details in JSON format, useful for passing connection info directly as CLI Input')
     parser.add_argument('--fingerprint', action='store', help='Override YAML fingerprint file path')
@@ -37,7 +49,47 @@ def parse_args(args=None):
     parser.add_argument('--shutup', action='store_true', help='Suppress the Hawk Eye banner 🫣', default=False)
     parser.add_argument('--version', action='version', version='%(prog)s v' + version) 
     parser.add_argument('--hawk-thuu', action='store_true', help="Delete all spitted files during testing phase forcefully")
-    return parser.parse_args(args)
+    parser.add_argument('--pattern-stats', action='store_true', help='Report the time, scanned size, evaluations and hits of each fingerprint, also added to the JSON output')
+    parser.add_argument('--shard', type=parse_shard, help='Scan only the i-th of N parts of the work (files, objects, tables, collections, channels), e.g. 1/4, to spread a scan over several nodes')
+    parsed = parser.parse_args(args, namespace=RunContext())
+    if parsed.inputs and parsed.command != 'merge':
+        parser.error(f"unrecognized arguments: {' '.join(parsed.inputs)}, only the merge command takes input files")
+    return parsed
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/N like 1/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', i must be between 1 and N")
+    return index, count
+
+def get_shard(args):
+    if args and isinstance(args, argparse.Namespace):
+        return getattr(args, 'shard', None)
+    return None
+
+def in_shard(args, *unit):
+    """
+    Whether this node scans a unit of work when running with --shard i/N.
+
+    Units are spread over the shards by a stable hash of their parts (source, profile, then path,
+    object key, table, collection, channel, document or file id), so every node agrees without coordination.
+    """
+    shard = get_shard(args)
+    if not shard:
+        return True
+    index, count = shard
+    key = '\x1f'.join(str(part) for part in unit).encode('utf-8', errors='replace')
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], 'big') % count == index - 1
+
+class RunContext(argparse.Namespace):
+    """
+    The parsed CLI arguments together with the state shared by the whole run. It is what gets
+    passed around as `args`, so the connection config is only read and validated once.
+    """
+    connections = None
     
 console = Console()
 
@@ -49,7 +101,7 @@ def print_info(args, message):
         console.print(f"[yellow][INFO][/yellow] {str(message)}")
 
 def print_debug(args, message):
-    if args and type(args) == argparse.Namespace and args.debug and not args.quiet:
+    if args and isinstance(args, argparse.Namespace) and args.debug and not args.quiet:
         try:
             console.print(f"[blue][DEBUG][/blue] {str(message)}")
         except Exception as e:
@@ -63,7 +115,16 @@ def print_success(args, message):
     if not args.quiet:
         console.print(f"[bold green]✅ {message}")
 
-def get_file_owner(file_path):
+@functools.lru_cache(maxsize=4096)
+def get_user_name(uid):
+    ## every lookup can be a network round trip on LDAP/NSS backed hosts, so each uid is resolved once
+    from pwd import getpwuid
+    try:
+        return getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+def get_file_owner(file_path, file_stat=None):
     owner_name = ""
 
     # Determine the current operating system
@@ -85,11 +146,10 @@ def get_file_owner(file_path):
             owner_name = ""
     else:
         try:
-            from pwd import getpwuid
             # Use the 'os.stat()' method to get the file owner on non-Windows systems
-            file_stat = os.stat(file_path)
-            owner_name = file_stat.st_uid  # You can also use pwd.getpwuid(file_stat.st_uid).pw_name to get the username
-            owner_name = getpwuid(owner_name).pw_name + " (" + str(owner_name) + ")"
+            file_stat = file_stat or os.stat(file_path)
+            owner_name = file_stat.st_uid
+            owner_name = get_user_name(owner_name) + " (" + str(owner_name) + ")"
         except OSError as e:
             owner_name = ""
 
@@ -119,6 +179,18 @@ def RedactData(input_string):
     return redacted_string
 
 def get_connection(args):
+    """
+    The connection config of the run. It is parsed and validated on the first call and kept
+    on the RunContext, so later calls are free.
+    """
+    if isinstance(args, RunContext) and args.connections is not None:
+        return args.connections
+    connections = validate_connection(args, load_connection(args))
+    if isinstance(args, RunContext):
+        args.connections = connections
+    return connections
+
+def load_connection(args):
     if args.connection:
         if os.path.exists(args.connection):
             with open(args.connection, 'r') as file:
@@ -138,8 +210,27 @@ def get_connection(args):
         print_error(args, "Please provide a connection file using --connection flag or connection details using --connection-json flag")
         exit(1)
 
+def validate_connection(args, connections):
+    if connections is None:
+        return {}
+    if not isinstance(connections, dict):
+        print_error(args, "Invalid connection config, expected a mapping with sources, notify and options sections")
+        exit(1)
+    for section in ('sources', 'notify', 'options'):
+        if section in connections and connections[section] is None:
+            ## an empty section in YAML, like `options:` with nothing under it
+            connections[section] = {}
+        if section in connections and not isinstance(connections[section], dict):
+            print_error(args, f"Invalid connection config, '{section}' should be a mapping")
+            exit(1)
+    for source, profiles in connections.get('sources', {}).items():
+        if profiles is not None and not isinstance(profiles, dict):
+            print_error(args, f"Invalid connection config, sources.{source} should be a mapping of profile names to their settings")
+            exit(1)
+    return connections
+
 def get_fingerprint_file(args=None):
-    if args and type(args) == argparse.Namespace and args.fingerprint:
+    if args and isinstance(args, argparse.Namespace) and args.fingerprint:
         if os.path.exists(args.fingerprint):
             with open(args.fingerprint, 'r') as file:
                 return yaml.safe_load(file)
@@ -150,23 +241,103 @@ def get_fingerprint_file(args=None):
     elif args and type(args) == dict and 'fingerprint' in args:
         return args['fingerprint']
     else:
-        file_path = "https://github.com/rohitcoder/hawk-eye/raw/main/fingerprint.yml"
+        return get_default_fingerprint(args)
+
+FINGERPRINT_URL = "https://github.com/rohitcoder/hawk-eye/raw/main/fingerprint.yml"
+PACKAGED_FINGERPRINT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fingerprint.yml')
+_default_fingerprint = None
+_default_fingerprint_lock = threading.Lock()
+
+def get_fingerprint_cache_dir():
+    return os.environ.get('HAWK_EYE_CACHE_DIR') or appdirs.user_cache_dir('hawk_scanner')
+
+def get_default_fingerprint(args=None):
+    """
+    Load the default fingerprints from the local cache, revalidating it against GitHub at most once per run.
+
+    The cached copy is revalidated with ETag/If-Modified-Since, and the copy shipped with the
+    package is used when the network is unreachable and nothing has been cached yet.
+
+    :param args: CLI arguments, only used for logging.
+    :return: Mapping of pattern name to regex.
+    """
+    global _default_fingerprint
+    if _default_fingerprint is not None:
+        return _default_fingerprint
+
+    with _default_fingerprint_lock:
+        if _default_fingerprint is not None:
+            return _default_fingerprint
+
+        verbose = args and isinstance(args, argparse.Namespace)
+        cache_dir = get_fingerprint_cache_dir()
+        cache_file = os.path.join(cache_dir, 'fingerprint.yml')
+        meta_file = os.path.join(cache_dir, 'fingerprint.json')
+        meta = {}
+        if os.path.exists(cache_file) and os.path.exists(meta_file):
+            try:
+                with open(meta_file, 'r') as file:
+                    meta = json.load(file)
+            except (OSError, ValueError):
+                meta = {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
         try:
-            response = requests.get(file_path, timeout=10)
-            if args:
-                print_info(args, f"Downloading default fingerprint.yml from {file_path}")
-            if response.status_code == 200:
-                with open('fingerprint.yml', 'wb') as file:
-                    file.write(response.content)
-                return yaml.safe_load(response.content)
+            import requests
+            if verbose:
+                print_info(args, f"Checking default fingerprint.yml from {FINGERPRINT_URL}")
+            response = requests.get(FINGERPRINT_URL, headers=headers, timeout=(3, 10))
+            if response.status_code == 304:
+                print_debug(args, f"Cached fingerprint.yml (version {meta.get('version', '')[:12]}) is up to date")
+            elif response.status_code == 200:
+                patterns = yaml.safe_load(response.content)
+                if not isinstance(patterns, dict):
+                    raise ValueError("downloaded fingerprint.yml is not a mapping of pattern names to regexes")
+                meta = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'version': hashlib.sha256(response.content).hexdigest(),
+                    'fetched_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp_file = cache_file + '.tmp'
+                    with open(tmp_file, 'wb') as file:
+                        file.write(response.content)
+                    os.replace(tmp_file, cache_file)
+                    with open(meta_file, 'w') as file:
+                        json.dump(meta, file)
+                except OSError as e:
+                    print_debug(args, f"Unable to write fingerprint cache in {cache_dir}: {e}")
+                print_debug(args, f"Downloaded fingerprint.yml version {meta['version'][:12]}")
+                _default_fingerprint = patterns
+                return _default_fingerprint
             else:
-                if args:
-                    print_error(args, f"Unable to download default fingerprint.yml please provide your own fingerprint file using --fingerprint flag")
-                exit(1)
+                print_debug(args, f"Unable to download default fingerprint.yml, status code: {response.status_code}")
         except Exception as e:
-            if args:
-                print_error(args, f"Unable to download default fingerprint.yml please provide your own fingerprint file using --fingerprint flag")
-            exit(1)
+            print_debug(args, f"Unable to download default fingerprint.yml: {e}")
+
+        for file_path in (cache_file, PACKAGED_FINGERPRINT):
+            if os.path.exists(file_path):
+                try:
+                    with open(file_path, 'r') as file:
+                        patterns = yaml.safe_load(file)
+                except (OSError, yaml.YAMLError) as e:
+                    print_debug(args, f"Unable to read {file_path}: {e}")
+                    continue
+                if isinstance(patterns, dict):
+                    print_debug(args, f"Using fingerprints from {file_path}")
+                    _default_fingerprint = patterns
+                    return _default_fingerprint
+
+        if verbose:
+            print_error(args, f"Unable to load default fingerprint.yml please provide your own fingerprint file using --fingerprint flag")
+        exit(1)
 
 def print_banner(args):
     line1 = "+ ================================================== +"
@@ -210,101 +381,608 @@ def print_banner(args):
     if not args.shutup:
         console.print(banner)
 
-def match_strings(args, content, source='text'):
-    redacted = False
-    if args and 'connection' in args:
-        connections = get_connection(args)
-        if 'notify' in connections:
-            redacted: bool = connections.get('notify', {}).get('redacted', False)
-    
-    patterns = get_fingerprint_file(args)
-    matched_strings = []
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+## characters of small values (DB cells, messages) matched together by match_batch, bigger
+## batches make the prefilter less selective as some value almost always has each literal
+MATCH_BATCH_SIZE = 4 * 1024
+_pattern_sets = {}
+_pattern_sets_lock = threading.Lock()
+## (data source, pattern name) -> [number of items it timed out on, sample text of the first one]
+_timed_out = {}
+_timed_out_lock = threading.Lock()
+## set in process pool workers, whose pattern stats and timeouts are sent back to the parent with each result
+_pattern_worker = False
+
+def _pattern_set_key(args):
+    if args and isinstance(args, argparse.Namespace):
+        return ('args', args.fingerprint, args.connection, args.connection_json)
+    elif args and type(args) == dict and 'fingerprint' in args:
+        return ('dict', json.dumps(args['fingerprint'], sort_keys=True))
+    return ('default',)
 
-    for pattern_name, pattern_regex in patterns.items():
-        if args:
-            print_debug(args, f"Matching pattern: {pattern_name}")
-        found = {} 
-        ## parse pattern_regex as Regex
-        complied_regex = re.compile(pattern_regex, re.IGNORECASE)
+def get_pattern_set(args=None):
+    """
+    Build the compiled fingerprints once per run and share them with every source.
+
+    :param args: CLI arguments, a dict with a `fingerprint` key, or None for the default fingerprints.
+    :return: A PatternSet holding the deduplicated, compiled patterns and the redaction setting.
+    """
+    key = _pattern_set_key(args)
+    pattern_set = _pattern_sets.get(key)
+    if pattern_set:
+        return pattern_set
+
+    with _pattern_sets_lock:
+        pattern_set = _pattern_sets.get(key)
+        if pattern_set:
+            return pattern_set
+        redacted = False
+        engine = None
+        timeout = None
+        if args and 'connection' in args:
+            connections = get_connection(args)
+            if 'notify' in connections:
+                redacted: bool = connections.get('notify', {}).get('redacted', False)
+            engine = connections.get('options', {}).get('match_engine')
+            timeout = connections.get('options', {}).get('match_timeout')
+            if timeout and not load_timed_re():
+                print_error(args, "match_timeout needs the regex package (pip3 install regex), matching without a time budget")
+        patterns = get_fingerprint_file(args)
+        lint_fingerprints(args, patterns)
+        stats = bool(args and isinstance(args, argparse.Namespace) and getattr(args, 'pattern_stats', False))
+        pattern_set = PatternSet(patterns, redacted=redacted, engine=engine, timeout=timeout, stats=stats)
         if args:
-            print_debug(args, f"Regex: {complied_regex}")
-            print_debug(args, f"Content: {content}")
-        matches = re.findall(complied_regex, content)
-        print_debug(args, f"Matches: {matches}")
-        found['data_source'] = source
-        if matches:
-            print_debug(args, f"Found {len(matches)} matches for pattern: {pattern_name}")
-            found['pattern_name'] = pattern_name
-            redacted_matches = []
-            if redacted:
-                if args:
-                    print_debug(args, f"Redacting matches for pattern: {pattern_name}")
-                for match in matches:
-                    print_debug(args, f"Redacting match: {match}")
-                    redacted_matches.append(RedactData(match))
-                found['matches'] = redacted_matches
-            else:
-                found['matches'] = matches
+            print_debug(args, f"Compiled {len(pattern_set)} unique patterns out of {len(pattern_set.patterns)} fingerprints using the {pattern_set.engine} engine")
+        _pattern_sets[key] = pattern_set
+    return pattern_set
 
-            if redacted:
-                found['sample_text'] = RedactData(content[:50])
+def lint_fingerprints(args, patterns):
+    """
+    Warn about fingerprints whose regex can backtrack heavily (ReDoS), see matcher.lint_regex.
+    The bundled fingerprints are only reported in debug mode, as there is nothing to fix locally.
+    """
+    custom = args and isinstance(args, argparse.Namespace) and args.fingerprint
+    for pattern_name, pattern_regex in (patterns or {}).items():
+        for warning in lint_regex(pattern_regex):
+            message = f"Fingerprint '{pattern_name}' may be slow on some input: {warning}"
+            if custom:
+                print_info(args, message)
             else:
-                found['sample_text'] = content[:50]
-            if found['matches'] and len(found['matches']) > 0:
-                found['matches'] = [x.strip() for x in found['matches']]
-                found['matches'] = list(set(found['matches']))
-            matched_strings.append(found)
+                print_debug(args, message)
+
+def report_timeouts(args, timed_out, source, sample_text):
+    """
+    Record the patterns that ran out of their match_timeout budget on an item and were skipped for it.
+    """
+    for pattern_name in timed_out:
+        if args and isinstance(args, argparse.Namespace):
+            print_error(args, f"Pattern '{pattern_name}' timed out on {source} content '{sample_text}', skipped it there")
+        merge_timeouts({(source, pattern_name): [1, sample_text]})
+
+def merge_timeouts(timeouts):
+    """
+    Add timeouts in the format of _timed_out, e.g. the ones taken from a worker process or a --shard output.
+    """
+    with _timed_out_lock:
+        for key, (count, sample_text) in timeouts.items():
+            recorded = _timed_out.setdefault(key, [0, sample_text])
+            recorded[0] += count
+
+def get_timed_out_patterns():
+    """
+    :return: One dict per data source and pattern that ran out of its match_timeout budget during
+             the run, with the number of items it was skipped on and the sample text of the first one.
+    """
+    with _timed_out_lock:
+        return [{'data_source': source, 'pattern_name': pattern_name, 'count': count, 'sample_text': sample_text}
+                for (source, pattern_name), (count, sample_text) in _timed_out.items()]
+
+def get_pattern_stats(args):
+    """
+    :return: Cost of each fingerprint so far, most expensive first, or None when --pattern-stats is not set.
+    """
+    pattern_set = get_pattern_set(args)
+    if pattern_set.stats is None:
+        return None
+    return pattern_set.stats.report()
+
+def take_worker_pattern_stats(args):
+    """
+    In a process pool worker, the (pattern stats, timeouts) gathered since the last call, to be
+    returned to the parent along with the task result and passed to merge_pattern_stats there.
+    None anywhere else.
+    """
+    global _timed_out
+    if not _pattern_worker:
+        return None
+    stats = get_pattern_set(args).stats
+    with _timed_out_lock:
+        timeouts, _timed_out = _timed_out, {}
+    return stats.take() if stats is not None else None, timeouts
+
+def merge_pattern_stats(args, worker_stats):
+    if not worker_stats:
+        return
+    counters, timeouts = worker_stats
+    stats = get_pattern_set(args).stats
+    if stats is not None and counters:
+        stats.merge(counters)
+    merge_timeouts(timeouts)
+
+def init_pattern_worker(args, patterns, redacted, engine, timeout, stats):
+    """
+    Initializer of the process pool workers: compiles the fingerprints once per worker from
+    what the parent already loaded, so workers neither download nor parse them again.
+    """
+    global _pattern_worker
+    _pattern_worker = True
+    _pattern_sets[_pattern_set_key(args)] = PatternSet(patterns, redacted=redacted, engine=engine, timeout=timeout, stats=stats)
+
+def create_process_pool(args, max_workers=None):
+    """
+    Process pool for CPU-bound matching, which threads cannot spread over cores because of the GIL.
+
+    :param args: CLI arguments, passed to every task and used to seed the workers' pattern set.
+    :param max_workers: Number of worker processes, defaults to the number of CPUs.
+    """
+    pattern_set = get_pattern_set(args)
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_pattern_worker,
+        initargs=(args, pattern_set.patterns, pattern_set.redacted, pattern_set.engine, pattern_set.timeout, pattern_set.stats is not None)
+    )
+
+def match_strings(args, content, source='text', patterns=None):
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    timed_out = []
+    hits = patterns.findall(content, timed_out)
+    report_timeouts(args, timed_out, source, content[:50])
+    return format_matches(args, hits, content[:50], source, patterns.redacted)
+
+def match_batch(args, values, keys, source='text', patterns=None):
+    """
+    Match many small values, like the cells of a table or the messages of a channel, with
+    one matcher pass per batch instead of one match_strings call per value.
+
+    :param args: CLI arguments.
+    :param values: Strings to scan.
+    :param keys: Key of each value (row, column, message id...), reported back with its matches.
+    :param source: Data source name reported with each match.
+    :param patterns: PatternSet to use, defaults to the one shared by the run.
+    :return: List of (key, matched strings in the match_strings format), for the values with matches.
+    """
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    results = []
+    batch_values, batch_keys, batch_size = [], [], 0
+    for key, value in zip(keys, values):
+        batch_values.append(value)
+        batch_keys.append(key)
+        batch_size += len(value)
+        if batch_size >= MATCH_BATCH_SIZE:
+            results += _match_batch(args, batch_values, batch_keys, source, patterns)
+            batch_values, batch_keys, batch_size = [], [], 0
+    results += _match_batch(args, batch_values, batch_keys, source, patterns)
+    return results
+
+def _match_batch(args, values, keys, source, patterns):
+    results = []
+    timed_out = []
+    batch_hits = patterns.findall_batch(values, timed_out)
+    for index, pattern_name in timed_out:
+        report_timeouts(args, [pattern_name], source, values[index][:50])
+    for key, value, hits in zip(keys, values, batch_hits):
+        if hits:
+            results.append((key, format_matches(args, hits, value[:50], source, patterns.redacted)))
+    return results
+
+def match_file_stream(args, file_path, source='text', patterns=None, chunk_size=None):
+    """
+    Match a text file chunk by chunk, so memory stays bounded whatever the file size.
+
+    :param args: CLI arguments.
+    :param file_path: Path of the file to scan, decoded as UTF-8 with replacement characters.
+    :param source: Data source name reported with each match.
+    :param patterns: PatternSet to use, defaults to the one shared by the run.
+    :param chunk_size: Number of characters scanned at a time.
+    :return: Matched strings, in the same format as match_strings.
+    """
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    timed_out = []
+    with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as file:
+        found, sample_text = patterns.findall_stream(file, chunk_size or STREAM_CHUNK_SIZE, timed_out)
+    report_timeouts(args, timed_out, source, sample_text)
+    return format_matches(args, found, sample_text, source, patterns.redacted)
+
+def match_file_mmap(args, file_path, source='text', patterns=None):
+    """
+    Match a file by running bytes regexes directly over its memory mapping, so the file
+    is neither copied into memory nor decoded, only the matches are.
+
+    :param args: CLI arguments.
+    :param file_path: Path of the file to scan.
+    :param source: Data source name reported with each match.
+    :param patterns: PatternSet to use, defaults to the one shared by the run.
+    :return: Matched strings in the same format as match_strings, or None when the file cannot be
+             mapped or has non-ASCII content, which has to go through the decoding path instead.
+    """
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    if not patterns.supports_bytes():
+        return None
+    with open(file_path, 'rb') as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError) as e:
+            ## empty files, pipes and special files cannot be mapped
+            print_debug(args, f"Cannot memory-map {file_path}: {e}")
+            return None
+        with mapped:
+            if not is_plain_bytes(mapped):
+                return None
+            timed_out = []
+            found, sample_text = patterns.findall_buffer(mapped, timed_out)
+    report_timeouts(args, timed_out, source, sample_text)
+    return format_matches(args, found, sample_text, source, patterns.redacted)
+
+SAMPLING_DEFAULTS = {
+    'threshold_mb': 256,
+    'head_mb': 8,
+    'tail_mb': 8,
+    'windows': 8,
+    'window_mb': 1,
+    'pages': 10,
+    'rows': 10000,
+}
+
+def get_sampling(args):
+    """
+    The `sampling` option: files over `threshold_mb` are only partly scanned, their head, their
+    tail and a few random windows in between, and their findings are marked as `sampled`.
+
+    :return: The sampling settings with their defaults filled in, or None when sampling is off.
+    """
+    if not args or 'connection' not in args:
+        return None
+    sampling = get_connection(args).get('options', {}).get('sampling')
+    if not sampling:
+        return None
+    settings = dict(SAMPLING_DEFAULTS)
+    if isinstance(sampling, dict):
+        settings.update(sampling)
+    return settings
+
+def should_sample(sampling, file_path):
+    return bool(sampling) and os.path.getsize(file_path) > sampling['threshold_mb'] * 1024 * 1024
+
+def sample_ranges(total, head, tail, windows, window, seed):
+    """
+    Pick the ranges of a sampled item: the first `head` and last `tail` units and `windows`
+    random windows of `window` units in between. Units are bytes, pages or rows.
+
+    :param seed: Seed of the random windows, so the same file is sampled the same way on every run.
+    :return: Sorted, non-overlapping list of (start, end) ranges, the whole item when it is small enough.
+    """
+    if total <= head + tail + windows * window:
+        return [(0, total)]
+    ranges = [(0, head), (total - tail, total)]
+    rng = random.Random(seed)
+    for _ in range(windows):
+        start = rng.randrange(head, total - tail - window + 1)
+        ranges.append((start, start + window))
+    merged = []
+    for start, end in sorted(ranges):
+        if start == end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def sample_seed(file_path):
+    return zlib.crc32(os.path.abspath(file_path).encode('utf-8', errors='replace'))
+
+def match_file_sampled(args, file_path, sampling, source='text', patterns=None):
+    """
+    Match only the sampled windows of a large file, see get_sampling.
+
+    :return: Matched strings, in the same format as match_strings.
+    """
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    megabyte = 1024 * 1024
+    ranges = sample_ranges(os.path.getsize(file_path), int(sampling['head_mb'] * megabyte), int(sampling['tail_mb'] * megabyte),
+                           int(sampling['windows']), int(sampling['window_mb'] * megabyte), sample_seed(file_path))
+    found = {}
+    sample_text = ''
+    timed_out = []
+    with open(file_path, 'rb') as file:
+        for start, end in ranges:
+            file.seek(start)
+            content = file.read(end - start).decode('utf-8', errors='replace')
+            if not sample_text:
+                sample_text = content[:50]
+            for pattern_name, matches in patterns.findall(content, timed_out).items():
+                found.setdefault(pattern_name, []).extend(matches)
+    print_debug(args, f"Sampled {sum(end - start for start, end in ranges)} bytes of {file_path} in {len(ranges)} windows")
+    report_timeouts(args, sorted(set(timed_out)), source, sample_text)
+    return format_matches(args, found, sample_text, source, patterns.redacted)
+
+def format_matches(args, hits, sample_text, source, redacted):
+    matched_strings = []
+
+    for pattern_name, matches in hits.items():
+        found = {}
+        found['data_source'] = source
+        print_debug(args, f"Found {len(matches)} matches for pattern: {pattern_name}")
+        found['pattern_name'] = pattern_name
+        redacted_matches = []
+        if redacted:
+            if args:
+                print_debug(args, f"Redacting matches for pattern: {pattern_name}")
+            for match in matches:
+                print_debug(args, f"Redacting match: {match}")
+                redacted_matches.append(RedactData(match))
+            found['matches'] = redacted_matches
+        else:
+            found['matches'] = matches
+
+        if redacted:
+            found['sample_text'] = RedactData(sample_text)
+        else:
+            found['sample_text'] = sample_text
+        if found['matches'] and len(found['matches']) > 0:
+            found['matches'] = [x.strip() for x in found['matches']]
+            found['matches'] = list(set(found['matches']))
+        matched_strings.append(found)
     if args:
         print_debug(args, f"Matched strings: {matched_strings}")
     ## remove duplicates from matches and return
     return matched_strings
 
+GLOB_CHARACTERS = re.compile(r'[*?[]')
+SYMLINK_POLICIES = ('files', 'follow', 'skip')
+_exclude_matchers = {}
+
+class ExcludeMatcher:
+    """
+    The exclude_patterns of a profile, compiled once into an extension set and two regexes.
+
+    A pattern excludes a file when it is the file extension or occurs in the file name, and a
+    folder when it occurs in the folder path. Patterns with glob characters (`*`, `?`, `[`) are
+    matched with fnmatch rules against the whole file name or folder path instead.
+    """
+
+    def __init__(self, exclude_patterns):
+        patterns = [str(pattern) for pattern in exclude_patterns or []]
+        self.extensions = set(patterns)
+        literals = [re.escape(pattern) for pattern in patterns if not GLOB_CHARACTERS.search(pattern)]
+        globs = [fnmatch.translate(pattern) for pattern in patterns if GLOB_CHARACTERS.search(pattern)]
+        self.literals = re.compile('|'.join(literals)) if literals else None
+        self.globs = re.compile('|'.join(f'(?:{glob})' for glob in globs)) if globs else None
+
+    def _pattern(self, name):
+        match = self.literals and self.literals.search(name)
+        if match:
+            return match.group(0)
+        match = self.globs and self.globs.match(name)
+        if match:
+            return match.group(0)
+        return None
+
+    def file_reason(self, file_name):
+        _, extension = os.path.splitext(file_name)
+        if extension in self.extensions:
+            return f"extension: {extension}"
+        pattern = self._pattern(file_name)
+        if pattern is not None:
+            return f"pattern: {pattern}"
+        return None
+
+    def excludes_folder(self, folder_name):
+        return self._pattern(folder_name) is not None
+
+def get_exclude_matcher(exclude_patterns):
+    key = tuple(str(pattern) for pattern in exclude_patterns or [])
+    matcher = _exclude_matchers.get(key)
+    if matcher is None:
+        matcher = _exclude_matchers[key] = ExcludeMatcher(key)
+    return matcher
+
 def should_exclude_file(args, file_name, exclude_patterns):
-    _, extension = os.path.splitext(file_name)
-    if extension in exclude_patterns:
-        print_debug(args, f"Excluding file: {file_name} because of extension: {extension}")
+    reason = get_exclude_matcher(exclude_patterns).file_reason(file_name)
+    if reason:
+        print_debug(args, f"Excluding file: {file_name} because of {reason}")
         return True
-    
-    for pattern in exclude_patterns:
-        if pattern in file_name:
-            print_debug(args, f"Excluding file: {file_name} because of pattern: {pattern}")
-            return True
     return False
 
 def should_exclude_folder(folder_name, exclude_patterns):
-    for pattern in exclude_patterns:
-        if pattern in folder_name:
-            return True
-    return False
+    return get_exclude_matcher(exclude_patterns).excludes_folder(folder_name)
+
+def walk_tree(args, path, exclude_patterns, max_depth=None, symlinks='files', one_file_system=False):
+    """
+    Walk `path` with os.scandir and yield the DirEntry of every regular file that is not excluded.
+
+    The DirEntry caches what the directory listing already told about the file, so callers
+    should prefer `entry.stat()` and `entry.is_file()` to calls on `entry.path`.
+
+    :param exclude_patterns: The exclude_patterns of the profile, see ExcludeMatcher.
+    :param max_depth: Number of folder levels to enter below `path`, None for no limit.
+    :param symlinks: `files` scans symlinked files but does not enter symlinked folders (like os.walk),
+                     `follow` enters symlinked folders too, every folder only once, and `skip` ignores symlinks.
+    :param one_file_system: Do not enter folders mounted from another filesystem than `path`.
+    """
+    matcher = get_exclude_matcher(exclude_patterns)
+    root_device = os.stat(path).st_dev if one_file_system else None
+    visited = set()
+    if symlinks == 'follow':
+        root_stat = os.stat(path)
+        visited.add((root_stat.st_dev, root_stat.st_ino))
+    stack = [(path, 0)]
+    while stack:
+        folder, depth = stack.pop()
+        folders = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        is_symlink = entry.is_symlink()
+                        if is_symlink and symlinks == 'skip':
+                            continue
+                        if entry.is_dir():
+                            if not is_symlink or symlinks == 'follow':
+                                folders.append(entry)
+                        elif entry.is_file():
+                            reason = matcher.file_reason(entry.name)
+                            if reason:
+                                print_debug(args, f"Excluding file: {entry.name} because of {reason}")
+                            else:
+                                yield entry
+                    except OSError as e:
+                        print_debug(args, f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            print_debug(args, f"Unable to list folder {folder}: {e}")
+            continue
+
+        if max_depth is not None and depth >= max_depth:
+            continue
+        ## pushed in reverse, so the folders are walked in listing order
+        for entry in reversed(folders):
+            if matcher.excludes_folder(entry.path):
+                continue
+            if one_file_system or symlinks == 'follow':
+                try:
+                    folder_stat = entry.stat()
+                except OSError:
+                    continue
+                if one_file_system and folder_stat.st_dev != root_device:
+                    print_debug(args, f"Not entering {entry.path}, it is on another filesystem")
+                    continue
+                if symlinks == 'follow':
+                    if (folder_stat.st_dev, folder_stat.st_ino) in visited:
+                        continue
+                    visited.add((folder_stat.st_dev, folder_stat.st_ino))
+            stack.append((entry.path, depth + 1))
+
+_text_caches = {}
+_text_caches_lock = threading.Lock()
+
+def get_text_cache(args):
+    """
+    The `text_cache` option: keep the text extracted from images, PDFs, videos and office documents
+    in a size-bounded cache keyed by content hash, see text_cache.TextCache.
+
+    :return: The TextCache of this process, or None when the option is off.
+    """
+    if not args or 'connection' not in args:
+        return None
+    settings = get_connection(args).get('options', {}).get('text_cache')
+    if not settings:
+        return None
+    if not isinstance(settings, dict):
+        settings = {}
+    path = settings.get('path', text_cache.CACHE_PATH)
+    key = (os.getpid(), path)
+    cache = _text_caches.get(key)
+    if cache:
+        return cache
+    with _text_caches_lock:
+        ## keyed by pid too, a connection inherited by a forked pool worker must not be used there
+        cache = _text_caches.get(key)
+        if cache is None:
+            cache = text_cache.TextCache(path, int(float(settings.get('max_mb', text_cache.DEFAULT_MAX_MB)) * 1024 * 1024))
+            _text_caches[key] = cache
+    return cache
+
+def get_cached_text(args, cache, file_path, extractor, content_hash=None):
+    """
+    :return: (content hash of the file, its cached text or None). The hash is None when the file
+             cannot be hashed or the cache cannot be read, nothing is stored for it then.
+    """
+    try:
+        content_hash = content_hash or file_index.hash_file(file_path)
+        content = cache.get(content_hash, extractor)
+    except (OSError, sqlite3.Error) as e:
+        print_debug(args, f"Text cache not used for {file_path}: {e}")
+        return None, None
+    if content is not None:
+        print_debug(args, f"Using the cached {extractor} text of {file_path}")
+    return content_hash, content
+
+def put_cached_text(args, cache, file_path, extractor, content_hash, content):
+    if content_hash is None:
+        return
+    try:
+        cache.put(content_hash, extractor, content)
+    except sqlite3.Error as e:
+        print_debug(args, f"Unable to cache the {extractor} text of {file_path}: {e}")
 
-def list_all_files_iteratively(args, path, exclude_patterns):
-    for root, dirs, files in os.walk(path, topdown=True):
-        dirs[:] = [d for d in dirs if not should_exclude_folder(os.path.join(root, d), exclude_patterns)]
+def extract_cached(args, file_path, extractor, extract, content_hash=None, cache_empty=False):
+    """
+    Run an expensive text extractor only when its text for this content is not cached yet.
 
-        for file in files:
-            if not should_exclude_file(args, file, exclude_patterns):
-                yield os.path.join(root, file)
+    :param extractor: Name of the extractor in text_cache.EXTRACTOR_VERSIONS.
+    :param extract: Callable returning the text of the file.
+    :param content_hash: file_index.hash_file() of the file when the caller already computed it.
+    :param cache_empty: Whether empty text is cached, extractors that return it on failure must not.
+    """
+    cache = get_text_cache(args)
+    if cache is None:
+        return extract()
+    content_hash, content = get_cached_text(args, cache, file_path, extractor, content_hash)
+    if content is not None:
+        return content
+    content = extract()
+    if content or cache_empty:
+        put_cached_text(args, cache, file_path, extractor, content_hash, content)
+    return content
 
-def scan_file(file_path, args=None, source=None):
+def scan_file(file_path, args=None, source=None, content_hash=None):
+    """
+    :param content_hash: file_index.hash_file() of the file when the caller already computed it.
+    """
     content = ''
     is_archive = False
+    sampling = get_sampling(args)
     # Check if the file is an image
     if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-        content = enhance_and_ocr(file_path)
+        ## enhance_and_ocr raises when it fails, so an image without text is cached too
+        content = extract_cached(args, file_path, 'ocr', lambda: enhance_and_ocr(file_path), content_hash, cache_empty=True)
     # Check if the file is a PDF document
     elif file_path.lower().endswith('.pdf'):
-        content = read_pdf(args, file_path)
-    # Check if the file is an office document (Word, Excel, PowerPoint)
-    elif file_path.lower().endswith(('.docx', '.xlsx', '.pptx')):
-        content = read_office_document(args, file_path)
+        ## matched page by page, see match_pdf
+        return match_pdf(args, file_path, source, sampling, content_hash)
+    # Spreadsheets are streamed and matched column by column, see match_spreadsheet
+    elif file_path.lower().endswith('.xlsx'):
+        return match_spreadsheet(args, file_path, source, sampling)
+    # Check if the file is an office document (Word, PowerPoint)
+    elif file_path.lower().endswith(('.docx', '.pptx')):
+        content = extract_cached(args, file_path, 'office', lambda: read_office_document(args, file_path), content_hash)
     # Check if the file is an archive (zip, rar, tar, tar.gz)
     elif file_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-        content = read_video(args, file_path)
+        content = extract_cached(args, file_path, 'video', lambda: read_video(args, file_path), content_hash)
     elif file_path.lower().endswith(('.zip', '.rar', '.tar', '.tar.gz')):
         ## this is archive, so we need to extract it and find pii from it, and return matched_strings
         matched_strings = find_pii_in_archive(args, file_path, source)
         is_archive = True
+    elif should_sample(sampling, file_path):
+        return mark_sampled(match_file_sampled(args, file_path, sampling, source))
     else:
+        # CSV exports are matched column by column like spreadsheets, unless they cannot be parsed
+        if file_path.lower().endswith(CSV_EXTENSIONS):
+            matched_strings = match_spreadsheet(args, file_path, source)
+            if matched_strings is not None:
+                return matched_strings
+        # Plain ASCII files are matched in place through a memory mapping
+        matched_strings = match_file_mmap(args, file_path, source)
+        if matched_strings is not None:
+            return matched_strings
+        # Large files are matched chunk by chunk instead of being read into memory at once
+        if os.path.getsize(file_path) > STREAM_CHUNK_SIZE:
+            return match_file_stream(args, file_path, source)
         # For other file types, read content normally
         with open(file_path, 'rb') as file:
             # Attempt to decode using UTF-8, fallback to 'latin-1' if needed
@@ -314,31 +992,164 @@ def scan_file(file_path, args=None, source=None):
         matched_strings = match_strings(args, content, source)
     return matched_strings
 
-def read_match_strings(args, file_path, source):
+def mark_sampled(matched_strings):
+    for matched in matched_strings:
+        matched['sampled'] = True
+    return matched_strings
+
+def read_match_strings(args, file_path, source, content_hash=None):
     print_info(args, f"Scanning file: {file_path} for Source: {source}")
     try:
-        matched_strings = scan_file(file_path, args, source)
+        matched_strings = scan_file(file_path, args, source, content_hash)
     except Exception as e:
         print_debug(args, f"Error in read_match_strings: {e}")
         matched_strings = []
     return matched_strings
 
-def read_pdf(args, file_path):
-    content = ''
+def add_match_details(result, match):
+    """
+    Copy where the matches of a read_match_strings match were found onto the result of a data
+    source: `sampled` when only part of the file was scanned (see the sampling option), the `pages`
+    of a PDF and the `locations` (sheets and columns) of a spreadsheet or CSV file.
+
+    :return: The result.
+    """
+    for detail in ('sampled', 'pages', 'locations'):
+        if match.get(detail):
+            result[detail] = match[detail]
+    return result
+
+## PDFs with more pages than this are extracted in page ranges spread over the extract pool
+PDF_RANGE_PAGES = 64
+## separates the pages of a PDF in the text cache
+PDF_PAGE_BREAK = '\f'
+
+def get_quick_exit(args):
+    """
+    :return: max_matches of the quick_exit option, or None when it is off.
+    """
+    if not args or 'connection' not in args:
+        return None
+    options = get_connection(args).get('options', {})
+    if not options.get('quick_exit', False):
+        return None
+    return options.get('max_matches', 1)
+
+def pdf_page_numbers(file_path, page_count, sampling=None):
+    page_numbers = range(page_count)
+    if sampling:
+        ranges = sample_ranges(page_count, int(sampling['pages']), int(sampling['pages']), int(sampling['windows']),
+                               1, sample_seed(file_path))
+        page_numbers = [page_num for start, end in ranges for page_num in range(start, end)]
+    return list(page_numbers)
+
+def extract_pdf_pages(file_path, page_numbers):
+    """
+    Text of some pages of a PDF, run in the extract pool for the ranges of big PDFs.
+    """
+    import PyPDF2
     try:
-        # Read content from PDF document
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):  # Use len() instead of deprecated numPages
-                page = pdf_reader.pages[page_num]
-                try:
-                    content += page.extract_text()
-                except UnicodeDecodeError:
-                    # Handle decoding errors by trying a different encoding
-                    content += page.extract_text(encoding='latin-1')
+            return [pdf_page_text(pdf_reader.pages[page_num]) for page_num in page_numbers]
     except Exception as e:
-        print_debug(args, f"Error in read_pdf: {e}")
-    return content
+        ## PyPDF2 errors may not unpickle in the parent
+        raise RuntimeError(f"Reading pages of {file_path} failed: {e}") from None
+
+def pdf_page_text(page):
+    try:
+        return page.extract_text()
+    except UnicodeDecodeError:
+        # Handle decoding errors by trying a different encoding
+        return page.extract_text(encoding='latin-1')
+
+def iter_pdf_pages(args, file_path, sampling=None):
+    """
+    Yield the (page number, text) of the pages of a PDF in order, without holding the text of the
+    whole document. Outside pool workers, the pages of big PDFs are extracted in PDF_RANGE_PAGES
+    ranges in parallel on the extract pool, the ranges not needed yet are cancelled when the
+    caller stops early.
+
+    :param sampling: get_sampling() settings when the file is sampled, only some pages are read then.
+    """
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_numbers = pdf_page_numbers(file_path, len(pdf_reader.pages), sampling)
+        if _pattern_worker or (os.cpu_count() or 1) < 2 or len(page_numbers) <= PDF_RANGE_PAGES:
+            for page_num in page_numbers:
+                yield page_num, pdf_page_text(pdf_reader.pages[page_num])
+            return
+    pool = get_extract_pool()
+    ranges = [page_numbers[start:start + PDF_RANGE_PAGES] for start in range(0, len(page_numbers), PDF_RANGE_PAGES)]
+    print_debug(args, f"Extracting {len(page_numbers)} pages of {file_path} in {len(ranges)} parallel ranges")
+    futures = [pool.submit(extract_pdf_pages, file_path, numbers) for numbers in ranges]
+    try:
+        for numbers, future in zip(ranges, futures):
+            yield from zip(numbers, future.result())
+    except BrokenProcessPool:
+        drop_extract_pool(pool)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+def match_pdf(args, file_path, source='text', sampling=None, content_hash=None, patterns=None):
+    """
+    Match a PDF page by page as its pages are extracted. Each finding lists the (1-based) `pages`
+    it was found on. With quick_exit, the remaining pages are not read once max_matches
+    fingerprints matched.
+
+    :param sampling: get_sampling() settings of the run, the file is sampled when it is big enough.
+    :param content_hash: file_index.hash_file() of the file when the caller already computed it.
+    :return: Matched strings, in the same format as match_strings.
+    """
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    sampled = should_sample(sampling, file_path)
+    cache = None if sampled else get_text_cache(args)
+    pages = None
+    if cache is not None:
+        content_hash, content = get_cached_text(args, cache, file_path, 'pdf', content_hash)
+        if content is not None:
+            pages = enumerate(content.split(PDF_PAGE_BREAK))
+    complete = pages is None
+    if pages is None:
+        pages = iter_pdf_pages(args, file_path, sampling if sampled else None)
+    max_matches = get_quick_exit(args)
+    found = {}
+    found_pages = {}
+    texts = []
+    sample_text = ''
+    timed_out = []
+    try:
+        for page_num, text in pages:
+            texts.append(text)
+            if len(sample_text) < 50:
+                sample_text += text[:50 - len(sample_text)]
+            for pattern_name, matches in patterns.findall(text, timed_out).items():
+                found.setdefault(pattern_name, []).extend(matches)
+                found_pages.setdefault(pattern_name, []).append(page_num + 1)
+            if max_matches and len(found) >= max_matches:
+                print_debug(args, f"Quick exit: stopped reading {file_path} after page {page_num + 1}")
+                complete = False
+                break
+    except Exception as e:
+        print_debug(args, f"Error in match_pdf: {e}")
+        complete = False
+    finally:
+        if hasattr(pages, 'close'):
+            pages.close()
+    ## only the whole text of a document that was read without errors is cached
+    if cache is not None and complete and any(texts):
+        put_cached_text(args, cache, file_path, 'pdf', content_hash, PDF_PAGE_BREAK.join(texts))
+    report_timeouts(args, sorted(set(timed_out)), source, sample_text)
+    matched_strings = format_matches(args, found, sample_text, source, patterns.redacted)
+    for matched in matched_strings:
+        matched['pages'] = found_pages[matched['pattern_name']]
+    if sampled:
+        mark_sampled(matched_strings)
+    return matched_strings
 
 def process_frame(frame, frame_num, args):
     """
@@ -350,6 +1161,7 @@ def process_frame(frame, frame_num, args):
     :return: Extracted text from the frame.
     """
     try:
+        import cv2, pytesseract
         gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
         # Resize for faster OCR if resolution is not critical
@@ -376,18 +1188,36 @@ def process_frames_parallel(frames, args):
         futures = [executor.submit(process_frame, frame, i, args) for i, frame in enumerate(frames)]
         return [future.result() for future in futures]
 
+## frames are compared on a FRAME_THUMBNAIL_SIZE grayscale thumbnail, a frame whose cells all stay within
+## FRAME_DIFF_THRESHOLD grey levels of the last OCRed frame shows the same thing (a typed character moves its cell further)
+FRAME_THUMBNAIL_SIZE = (64, 64)
+FRAME_DIFF_THRESHOLD = 6
+
+def frame_thumbnail(frame):
+    import cv2
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray_frame, FRAME_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype('int16')
+
+def is_same_frame(thumbnail, previous):
+    return previous is not None and int(abs(thumbnail - previous).max()) <= FRAME_DIFF_THRESHOLD
+
 def read_video(args, file_path, frame_interval=30, max_workers=10):
     """
     Extract text from a video file by applying OCR on its frames.
 
+    Skipped frames are only grabbed, not decoded into images, at most `max_workers` frames are
+    waiting for OCR at once, and a frame that looks the same as the last OCRed one (a still
+    screen recording) is not OCRed again.
+
     :param args: Arguments for debugging or additional settings.
     :param file_path: Path to the video file.
     :param frame_interval: Interval to capture frames (default is every 30 frames).
-    :param max_workers: Number of parallel workers (default is 4).
-    :return: Extracted text content from video frames.
+    :param max_workers: Number of parallel workers (default is 10).
+    :return: Extracted text content from video frames, in frame order.
     """
     content = ''
     try:
+        import cv2
         # Open the video file
         cap = cv2.VideoCapture(file_path)
 
@@ -398,30 +1228,44 @@ def read_video(args, file_path, frame_interval=30, max_workers=10):
         frame_rate = cap.get(cv2.CAP_PROP_FPS)
         print_debug(args, f"Processing {frame_count} frames at {frame_rate} FPS")
 
-        futures = []
+        futures = {}
+        texts = {}
         processed_frames = 0
+        same_frames = 0
+        previous = None
+        frame_num = 0
 
         # Create a ThreadPoolExecutor for parallel processing
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for frame_num in range(frame_count):
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Process only every `frame_interval`-th frame
+            ## the frame count of the container may be wrong, read until the stream ends
+            while cap.grab():
+                # Process only every `frame_interval`-th frame, the others are never decoded
                 if frame_num % frame_interval == 0:
-                    print_debug(args, f"Submitting frame {frame_num}/{frame_count} for processing")
-                    # Submit the frame to the thread pool for processing
-                    futures.append(executor.submit(process_frame, frame, frame_num, args))
-                    processed_frames += 1
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    thumbnail = frame_thumbnail(frame)
+                    if is_same_frame(thumbnail, previous):
+                        same_frames += 1
+                    else:
+                        previous = thumbnail
+                        if len(futures) >= max_workers:
+                            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                texts[futures.pop(future)] = future.result()
+                        print_debug(args, f"Submitting frame {frame_num}/{frame_count} for processing")
+                        # Submit the frame to the thread pool for processing
+                        futures[executor.submit(process_frame, frame, frame_num, args)] = frame_num
+                        processed_frames += 1
+                frame_num += 1
 
             # Wait for all submitted frames to complete and gather the results
             for future in as_completed(futures):
-                text = future.result()
-                content += text + '\n'
+                texts[futures[future]] = future.result()
 
         cap.release()
-        print_debug(args, f"Processed {processed_frames} frames out of {frame_count}")
+        content = ''.join(texts[num] + '\n' for num in sorted(texts))
+        print_debug(args, f"Processed {processed_frames} frames out of {frame_num}, skipped {same_frames} unchanged frames")
 
     except Exception as e:
         print_debug(args, f"Error in read_video: {e}")
@@ -429,32 +1273,217 @@ def read_video(args, file_path, frame_interval=30, max_workers=10):
     return content
 
 
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_DRAWING_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_PRESENTATION_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+## zip members holding the text of each OOXML format, in reading order
+OOXML_PARTS = {
+    '.docx': ('word/document.xml', 'word/header*.xml', 'word/footer*.xml', 'word/footnotes.xml', 'word/endnotes.xml', 'word/comments*.xml'),
+    '.pptx': ('ppt/slides/slide*.xml', 'ppt/notesSlides/notesSlide*.xml', 'ppt/comments/*.xml'),
+    ## cells are read by iter_spreadsheet_rows, the shared strings are only the text cells of the sheets
+    '.xlsx': ('xl/comments*.xml',),
+}
+## elements whose text is extracted (w:delText keeps what tracked changes removed, p:text is a legacy slide comment)
+OOXML_TEXT_TAGS = {_WORD_NS + 't', _WORD_NS + 'delText', _DRAWING_NS + 't', _PRESENTATION_NS + 'text', _SHEET_NS + 't'}
+## elements ending a paragraph, a shared string or a comment
+OOXML_BREAK_TAGS = {_WORD_NS + 'p', _DRAWING_NS + 'p', _SHEET_NS + 'si', _SHEET_NS + 'comment'}
+OOXML_TAB_TAGS = {_WORD_NS + 'tab'}
+OOXML_LINE_BREAK_TAGS = {_WORD_NS + 'br', _DRAWING_NS + 'br'}
+
+def _part_order(name):
+    ## slide10.xml comes after slide2.xml
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def ooxml_parts(names, extension):
+    parts = []
+    for pattern in OOXML_PARTS[extension]:
+        parts += sorted(fnmatch.filter(names, pattern), key=_part_order)
+    return parts
+
+def iter_ooxml_text(file_path, parts=None):
+    """
+    Stream the text of a .docx, .pptx or .xlsx file straight from its zip container with an
+    incremental XML parser: body, tables, headers, footers, notes and comments of documents,
+    slides, notes and comments of presentations, and cell comments of workbooks. Parsed elements
+    are dropped as each paragraph ends, so memory does not grow with the document.
+
+    :param parts: fnmatch patterns of the zip members to read, defaults to OOXML_PARTS of the extension.
+    :return: Generator of the text of each paragraph.
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+    extension = os.path.splitext(file_path.lower())[1]
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        members = ooxml_parts(names, extension) if parts is None else [name for pattern in parts for name in sorted(fnmatch.filter(names, pattern), key=_part_order)]
+        for member in members:
+            with archive.open(member) as part:
+                texts = []
+                for _, element in iterparse(part, events=('end',)):
+                    tag = element.tag
+                    if tag in OOXML_TEXT_TAGS:
+                        texts.append(element.text or '')
+                    elif tag in OOXML_TAB_TAGS:
+                        texts.append('\t')
+                    elif tag in OOXML_LINE_BREAK_TAGS:
+                        texts.append('\n')
+                    elif tag in OOXML_BREAK_TAGS:
+                        if texts:
+                            yield ''.join(texts)
+                            texts = []
+                        element.clear()
+                if texts:
+                    yield ''.join(texts)
+
 def read_office_document(args, file_path):
-    content = ''
+    """
+    Text of a Word document or PowerPoint presentation, spreadsheets go through match_spreadsheet.
+    """
+    texts = []
     try:
-        # Check the file type and read content accordingly
-        if file_path.lower().endswith('.docx'):
-            # Read content from Word document
-            doc = Document(file_path)
-            for paragraph in doc.paragraphs:
-                content += paragraph.text + '\n'
-        elif file_path.lower().endswith('.xlsx'):
-            # Read content from Excel spreadsheet
-            workbook = load_workbook(file_path)
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                for row in sheet.iter_rows():
-                    for cell in row:
-                        content += str(cell.value) + '\n'
-        elif file_path.lower().endswith('.pptx'):
-            # Read content from PowerPoint presentation
-            # You can add specific logic for PowerPoint if needed
-            pass
+        # Read the text of Word documents and PowerPoint presentations from their XML parts
+        texts.extend(iter_ooxml_text(file_path))
     except Exception as e:
         print_debug(args, f"Error in read_office_document: {e}")
-    return content
+    return ''.join(text + '\n' for text in texts)
+
+CSV_EXTENSIONS = ('.csv', '.tsv')
+CSV_DELIMITERS = ',;\t|'
+_LETTER = re.compile(r'[^\W\d_]')
+
+@functools.lru_cache(maxsize=1024)
+def column_letter(index):
+    """
+    :return: Spreadsheet name of the 0-based column index: A, B, ..., Z, AA, ...
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def iter_spreadsheet_rows(file_path, sampling=None):
+    """
+    Stream the rows of an .xlsx workbook (read-only, the sheets are parsed as they are read) or
+    of a CSV export, without loading the whole file.
+
+    :param sampling: get_sampling() settings when the file is sampled, only some rows of each sheet are read then.
+    :return: Generator of (sheet name, tuple of cell values), the sheet name is None for CSV files.
+    """
+    if file_path.lower().endswith(CSV_EXTENSIONS):
+        import csv
+        with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as file:
+            ## the delimiter occurring most in the header line, csv.Sniffer takes seconds on wide samples
+            header = file.readline()
+            delimiter = max(CSV_DELIMITERS, key=header.count) if any(header.count(d) for d in CSV_DELIMITERS) else ','
+            file.seek(0)
+            for row in csv.reader(file, delimiter=delimiter):
+                yield None, row
+        return
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            ranges = None
+            ## the row count comes from the sheet's dimension, which some writers leave out
+            if sampling and sheet.max_row:
+                ranges = sample_ranges(sheet.max_row, int(sampling['rows']), int(sampling['rows']), int(sampling['windows']),
+                                       int(sampling['rows']), sample_seed(file_path))
+            range_index = 0
+            ## read-only sheets are parsed from the start on every iter_rows, so sampled rows are picked in one pass
+            for row_num, row in enumerate(sheet.iter_rows(values_only=True)):
+                if ranges is not None:
+                    while range_index < len(ranges) and row_num >= ranges[range_index][1]:
+                        range_index += 1
+                    if range_index == len(ranges):
+                        break
+                    if row_num < ranges[range_index][0]:
+                        continue
+                yield sheet.title, row
+    finally:
+        workbook.close()
+
+def match_spreadsheet(args, file_path, source='text', sampling=None, patterns=None):
+    """
+    Match the cells of an .xlsx workbook or CSV export as its rows are streamed. Values are
+    batched column by column into the matcher, empty cells are skipped and cells without letters
+    (numbers, dates) are only matched against the fingerprints that can match them. Each finding
+    lists the `locations` it was found in, `Sheet!C` for workbooks and `C` for CSV files.
+
+    :param sampling: get_sampling() settings of the run, the file is sampled when it is big enough.
+    :return: Matched strings, in the same format as match_strings, or None when a CSV file cannot be
+             parsed (a field over the csv module limit), it has to be matched as text then.
+    """
+    import csv
+    if not isinstance(patterns, PatternSet):
+        patterns = get_pattern_set(args)
+    sampled = should_sample(sampling, file_path)
+    letter_free = patterns.letter_free()
+    ## location -> [values with letters, their size, values without, their size]
+    columns = {}
+    found = {}
+    locations = {}
+    sample_text = ''
+    timed_out = []
+    try:
+        for sheet_name, row in iter_spreadsheet_rows(file_path, sampling if sampled else None):
+            for index, value in enumerate(row):
+                if value is None or isinstance(value, bool):
+                    continue
+                value = str(value)
+                if not value:
+                    continue
+                if len(sample_text) < 50:
+                    sample_text += (value + '\n')[:50 - len(sample_text)]
+                location = column_letter(index) if sheet_name is None else f"{sheet_name}!{column_letter(index)}"
+                column = columns.get(location)
+                if column is None:
+                    column = columns[location] = [[], 0, [], 0]
+                slot = 0 if _LETTER.search(value) else 2
+                ## each cell ends with a newline as in the text of the whole file, patterns like
+                ## Basic Auth Credentials need a delimiter after the value to match
+                column[slot].append(value + '\n')
+                column[slot + 1] += len(value) + 1
+                if column[slot + 1] >= MATCH_BATCH_SIZE:
+                    _match_column(patterns if slot == 0 else letter_free, column[slot], location, found, locations, timed_out)
+                    column[slot:slot + 2] = [[], 0]
+        if file_path.lower().endswith('.xlsx'):
+            ## cell comments are not part of the rows
+            _match_column(patterns, [text + '\n' for text in iter_ooxml_text(file_path)], 'comments', found, locations, timed_out)
+    except csv.Error as e:
+        print_debug(args, f"Cannot parse {file_path} as CSV, matching it as text: {e}")
+        return None
+    except Exception as e:
+        print_debug(args, f"Error in match_spreadsheet: {e}")
+    for location, column in columns.items():
+        _match_column(patterns, column[0], location, found, locations, timed_out)
+        _match_column(letter_free, column[2], location, found, locations, timed_out)
+    report_timeouts(args, sorted(set(timed_out)), source, sample_text)
+    found = {pattern_name: list(found[pattern_name]) for pattern_name in sorted(found, key=patterns.order.get)}
+    matched_strings = format_matches(args, found, sample_text, source, patterns.redacted)
+    for matched in matched_strings:
+        matched['locations'] = locations[matched['pattern_name']]
+    if sampled:
+        mark_sampled(matched_strings)
+    return matched_strings
+
+def _match_column(patterns, values, location, found, locations, timed_out):
+    if not values:
+        return
+    batch_timed_out = []
+    for hits in patterns.findall_batch(values, batch_timed_out):
+        for pattern_name, matches in hits.items():
+            ## an ordered set, a column often repeats the same value
+            found.setdefault(pattern_name, {}).update(dict.fromkeys(matches))
+            pattern_locations = locations.setdefault(pattern_name, [])
+            if location not in pattern_locations:
+                pattern_locations.append(location)
+    timed_out.extend(pattern_name for _, pattern_name in batch_timed_out)
 
 def find_pii_in_archive(args, file_path, source):
+    import patoolib
     content = []
     # Create a temporary directory to extract the contents of the archive
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -481,13 +1510,16 @@ def find_pii_in_archive(args, file_path, source):
     return content
 
 
-def getFileData(file_path):
+def getFileData(file_path, file_stat=None):
+    """
+    :param file_stat: os.stat_result of the file when the caller already has it, saves a stat call.
+    """
     try:
         # Get file metadata
-        file_stat = os.stat(file_path)
+        file_stat = file_stat or os.stat(file_path)
 
         # Get the username of the file's creator (Windows)
-        creator_name = get_file_owner(file_path)
+        creator_name = get_file_owner(file_path, file_stat)
         # Convert timestamps to human-readable format
         created_time = datetime.datetime.fromtimestamp(file_stat.st_ctime)
         modified_time = datetime.datetime.fromtimestamp(file_stat.st_mtime)
@@ -508,6 +1540,8 @@ def getFileData(file_path):
 
 
 def SlackNotify(msg, args):
+    import requests
+    from tinydb import TinyDB, Query
     connections = get_connection(args)
     if not args.no_write:
         db = TinyDB('previous_alerts.json')
@@ -548,6 +1582,7 @@ def SlackNotify(msg, args):
                 print_error(args, f"An error occurred: {str(e)}")
 
 def evaluate_severity(json_data, rules):
+    import jmespath
     if 'severity_rules' not in rules:
         rules = {
             'severity_rules': {
@@ -581,24 +1616,53 @@ def evaluate_severity(json_data, rules):
     json_data['severity_description'] = "No matching rule found."
     return json_data
 
-def enhance_and_ocr(image_path):
-    # Load the image
-    original_image = Image.open(image_path)
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
 
-    # Enhance the image (you can adjust enhancement factors as needed)
-    enhanced_image = enhance_image(original_image)
-
-    # Save the enhanced image for reference
-    enhanced_image.save("enhanced_image.png")
-
-    # Perform OCR on the enhanced image
-    ocr_text = perform_ocr(enhanced_image)
-    ## delete the enhanced image
-    os.remove("enhanced_image.png")
+def get_extract_pool():
+    """
+    Process pool shared by every image OCR and big PDF of the run, sized to the core count.
+    Enhancing, OCR and PDF parsing are CPU bound, so files from all sources and threads
+    scale over the cores through it.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _extract_pool
+
+def drop_extract_pool(pool):
+    ## a worker died (out of memory, killed), start a new pool for the next files
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+
+def ocr_image(image_path):
+    from PIL import Image
+    try:
+        # Load the image, then enhance and OCR it in memory
+        with Image.open(image_path) as original_image:
+            return perform_ocr(enhance_image(original_image))
+    except Exception as e:
+        ## some errors (pytesseract's TesseractNotFoundError) cannot be unpickled and would break the pool
+        raise RuntimeError(f"OCR of {image_path} failed: {e}") from None
 
-    return ocr_text
+def enhance_and_ocr(image_path):
+    ## a pattern worker process already is one of the pool processes the work is spread over
+    if _pattern_worker:
+        return ocr_image(image_path)
+    pool = get_extract_pool()
+    try:
+        return pool.submit(ocr_image, image_path).result()
+    except BrokenProcessPool:
+        drop_extract_pool(pool)
+        raise
 
 def enhance_image(image):
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageEnhance
     # Convert to grayscale
     grayscale_image = image.convert('L')
 
@@ -617,12 +1681,15 @@ def enhance_image(image):
     return Image.fromarray(denoised_image)
 
 def perform_ocr(image):
+    import pytesseract
     # Use Tesseract OCR
     ocr_text = pytesseract.image_to_string(image)
 
     return ocr_text
 
 def get_jira_accId(args, email):
+    import requests
+    from tinydb import TinyDB, Query
     config = get_connection(args)
     jira_config = config.get('notify', {}).get('jira', {})
     server_url = jira_config.get('server_url')
@@ -660,6 +1727,8 @@ def get_jira_accId(args, email):
         return None
     
 def create_jira_ticket(args, issue_data, message):
+    import requests
+    from tinydb import TinyDB, Query
     orig_msg = message
     config = get_connection(args)
     if not args.no_write:
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.path.join('data', 'text_cache.db')
+DEFAULT_MAX_MB = 1024
+## bump the version of an extractor when the text it produces changes, its older entries are then never hit again
+EXTRACTOR_VERSIONS = {
+    'ocr': 1,
+    'pdf': 2,
+    'video': 2,
+    'office': 2,
+}
+## evict down to this share of the size bound, so eviction does not run on every store once full
+EVICT_TO = 0.9
+EVICT_BATCH = 100
+
+class TextCache:
+    """
+    SQLite cache of the text extracted from images, PDFs, videos and office documents, keyed by
+    the content hash of the file and the extractor with its version. Renamed, copied or re-fetched
+    files with the same bytes are not OCRed or parsed again, and when the fingerprints change only
+    the matching runs again.
+
+    The cache is bounded in size, the least recently used entries are evicted first. The total size
+    is kept in the meta table and updated in the same transaction as each store, so stores do not
+    sum the table. It is shared by the threads of a process through a lock, and by processes
+    through SQLite's own locking.
+
+    :param path: Path of the SQLite database, created with its directory when missing.
+    :param max_bytes: Size bound of the cached text.
+    """
+
+    def __init__(self, path, max_bytes):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS texts (hash TEXT, extractor TEXT, version INTEGER, text TEXT, size INTEGER, used REAL, PRIMARY KEY (hash, extractor, version))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS texts_used ON texts (used)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        ## caches written before the total was kept, or by a process that died mid-way, are summed once
+        self.connection.execute("INSERT OR IGNORE INTO meta SELECT 'total', COALESCE(SUM(size), 0) FROM texts")
+        self.connection.commit()
+
+    def get(self, content_hash, extractor):
+        """
+        :return: The cached text of the content for the current version of the extractor, or None.
+        """
+        key = (content_hash, extractor, EXTRACTOR_VERSIONS[extractor])
+        with self.lock:
+            row = self.connection.execute('SELECT text FROM texts WHERE hash = ? AND extractor = ? AND version = ?', key).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE texts SET used = ? WHERE hash = ? AND extractor = ? AND version = ?', (time.time(), *key))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, content_hash, extractor, text):
+        size = len(text.encode('utf-8', errors='replace'))
+        if size > self.max_bytes:
+            return
+        key = (content_hash, extractor, EXTRACTOR_VERSIONS[extractor])
+        with self.lock:
+            ## immediate, so no other process changes the total between reading and writing it
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('SELECT size FROM texts WHERE hash = ? AND extractor = ? AND version = ?', key).fetchone()
+                self.connection.execute('INSERT OR REPLACE INTO texts VALUES (?, ?, ?, ?, ?, ?)', (*key, text, size, time.time()))
+                total = self._add_total(size - (row[0] if row else 0))
+                if total > self.max_bytes:
+                    self._evict(total)
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+    def _add_total(self, delta):
+        self.connection.execute("UPDATE meta SET value = value + ? WHERE key = 'total'", (delta,))
+        return self.connection.execute("SELECT value FROM meta WHERE key = 'total'").fetchone()[0]
+
+    def _evict(self, total):
+        target = int(self.max_bytes * EVICT_TO)
+        while total > target:
+            rows = self.connection.execute('SELECT rowid, size FROM texts ORDER BY used LIMIT ?', (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            for rowid, size in rows:
+                if total <= target:
+                    break
+                self.connection.execute('DELETE FROM texts WHERE rowid = ?', (rowid,))
+                total = self._add_total(-size)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -10,6 +10,7 @@ from rich.panel import Panel
 from rich.text import Text
 from collections import defaultdict
 from hawk_scanner.internals import system
+from hawk_scanner.internals.matcher import PatternStats
 from rich import print
 import ssl
 
@@ -40,13 +41,40 @@ def execute_command(command, args):
 
 def group_results(args, results):
     grouped_results = defaultdict(list)
+    connection = system.get_connection(args)
     for result in results:
-        connection = system.get_connection(args)
         result = system.evaluate_severity(result, connection)
         grouped_results[result['data_source']].append(result)
     return grouped_results
 
 
+def merge_outputs(args, paths):
+    """
+    Combine the JSON outputs of --shard runs into the grouped format of a single run. Their
+    pattern timeouts are added to the ones of this run, see system.get_timed_out_patterns.
+
+    :return: (grouped results, pattern stats or None when no output has them)
+    """
+    grouped_results = defaultdict(list)
+    pattern_stats = None
+    for path in paths:
+        try:
+            with open(path, 'r') as file:
+                output = json.load(file)
+        except (OSError, ValueError) as e:
+            system.print_error(args, f"Unable to read {path}: {e}")
+            sys.exit(1)
+        for group, group_data in output.items():
+            if group == 'pattern_stats':
+                pattern_stats = pattern_stats or PatternStats()
+                pattern_stats.merge({row['pattern_name']: [row[field] for field in PatternStats.FIELDS] for row in group_data})
+            elif group == 'timed_out':
+                system.merge_timeouts({(row['data_source'], row['pattern_name']): [row['count'], row['sample_text']] for row in group_data})
+            else:
+                grouped_results[group].extend(group_data)
+    return grouped_results, pattern_stats.report() if pattern_stats else None
+
+
 def format_slack_message(group, result, records_mini, mention):
     template_map = {
         's3': """
@@ -216,6 +244,21 @@ def add_columns_to_table(group, table):
     table.add_column("Sample Text")
 
 
+def print_pattern_stats(pattern_stats):
+    table = Table(show_header=True, header_style="bold magenta", show_lines=False,
+                  title="[bold blue]Fingerprint cost, most expensive first[/bold blue]")
+    table.add_column("Pattern Name")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Scanned", justify="right")
+    table.add_column("Evaluations", justify="right")
+    table.add_column("Hits", justify="right")
+    table.add_column("Timeouts", justify="right")
+    for row in pattern_stats:
+        table.add_row(row['pattern_name'], f"{row['seconds']:.3f}", f"{row['bytes']:,}",
+                      f"{row['evaluations']:,}", f"{row['hits']:,}", str(row['timeouts']))
+    console.print(table)
+
+
 def main():
     start_time = time.time()
 
@@ -223,32 +266,53 @@ def main():
     system.print_banner(args)
     results = []
     
-    if args.command:
+    if args.command == 'merge':
+        if not args.inputs:
+            system.print_error(args, "Please provide the JSON outputs of the --shard runs to merge")
+            sys.exit(1)
+        grouped_results, pattern_stats = merge_outputs(args, args.inputs)
+    elif args.command:
         connections = system.get_connection(args)
         data_sources = connections.get('sources', {}).keys()
         commands = [args.command] if args.command != 'all' else data_sources
         for command in commands:
             results.extend(execute_command(command, args))
+        grouped_results = group_results(args, results)
+        pattern_stats = system.get_pattern_stats(args) if args.pattern_stats else None
     else:
         system.print_error(args, "Please provide a command to execute")
         sys.exit(1)
 
-    grouped_results = group_results(args, results)
+    output = dict(grouped_results)
+    if pattern_stats is not None:
+        output['pattern_stats'] = pattern_stats
+    ## fingerprints skipped on some items because they ran out of their match_timeout budget
+    timed_out = system.get_timed_out_patterns()
+    if timed_out:
+        output['timed_out'] = timed_out
     if args.json:
         if args.json:
             with open(args.json, 'w') as file:
-                file.write(json.dumps(grouped_results, indent=4))
+                file.write(json.dumps(output, indent=4))
             system.print_success(args, f"Results saved to {args.json}")
         else:
-            print(json.dumps(grouped_results, indent=4))
+            print(json.dumps(output, indent=4))
+        if pattern_stats is not None:
+            print_pattern_stats(pattern_stats)
         sys.exit(0)
 
     if args.stdout:
-        print(json.dumps(grouped_results, indent=4))
+        print(json.dumps(output, indent=4))
         sys.exit(0)
 
     # Display results in the table format
     console.print(Panel(Text("Now, let's look at findings!", justify="center")))
+    ## merged findings were already notified by the nodes that found them
+    notify = args.command != 'merge'
+    mention = ''
+    if notify:
+        connection = system.get_connection(args)
+        mention = connection.get('notify', {}).get('slack', {}).get('mention', '')
 
     for group, group_data in grouped_results.items():
         table = Table(show_header=True, header_style="bold magenta", show_lines=True, 
@@ -258,9 +322,7 @@ def main():
         add_columns_to_table(group, table)
         for i, result in enumerate(group_data, 1):
             records_mini = ', '.join(result['matches']) if len(result['matches']) < 25 else ', '.join(result['matches'][:25]) + f" + {len(result['matches']) - 25} more"
-            connection = system.get_connection(args)
-            mention = connection.get('notify', {}).get('slack', {}).get('mention', '')
-            slack_message = format_slack_message(group, result, records_mini, mention)
+            slack_message = format_slack_message(group, result, records_mini, mention) if notify else None
             if slack_message:
                 system.create_jira_ticket(args, result, slack_message)
                 system.SlackNotify(slack_message, args)
@@ -305,6 +367,9 @@ def main():
 
         console.print(table)
 
+    if pattern_stats is not None:
+        print_pattern_stats(pattern_stats)
+
     if args.hawk_thuu:
         console.print("Hawk thuuu, Spitting on that thang!....")
         os.system("rm -rf data/*")
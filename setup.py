@@ -29,6 +29,9 @@ setup(
     install_requires=requires,
     extras_require={
         "dev": ["twine>=4.0.2"],
+        "re2": ["google-re2"],
+        "ahocorasick": ["pyahocorasick"],
+        "timeout": ["regex"],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',